@@ -0,0 +1,139 @@
+"""Online backup time and its effect on handler latency.
+
+Run from the repository root: ``python benchmarks/backup.py [size_mb]``
+(default 1024). Builds a database of about that size in a temporary
+directory, measures handler-like queries on their own, then while a backup
+runs, and finally times a restore. Needs about 2.5x the size in free disk.
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USERS = 100_000
+BATCH = 10_000
+# one simulated update every INTERVAL seconds
+INTERVAL = 0.01
+BASELINE_SECONDS = 10
+
+
+def fill(db_file, size_mb):
+    """Tasks with incompressible payloads, like the encrypted ones."""
+    conn = sqlite3.connect(db_file)
+    target = size_mb * 1024 * 1024
+    while os.path.getsize(db_file) < target:
+        rows = [
+            (
+                random.randrange(USERS),
+                os.urandom(random.randint(40, 200)),
+                os.urandom(random.randint(200, 1500)),
+            )
+            for _ in range(BATCH)
+        ]
+        with conn:
+            conn.executemany(
+                "INSERT INTO tasks (user_id, task, description) VALUES (?, ?, ?)",
+                rows,
+            )
+    (tasks,) = conn.execute("SELECT MAX(id) FROM tasks").fetchone()
+    conn.close()
+    return tasks
+
+
+async def handler(db, tasks):
+    # a task view and a status toggle, as in the task menu
+    task_id = random.randint(1, tasks)
+    await db.get_user_settings(random.randrange(USERS))
+    async with db.connect() as conn:
+        await conn.execute(
+            "SELECT task, description, status FROM tasks WHERE id = ?", (task_id,)
+        )
+        await conn.execute(
+            "UPDATE tasks SET status = 1 - status WHERE id = ?", (task_id,)
+        )
+        await conn.commit()
+
+
+async def probe(db, tasks, until):
+    latencies, lags = [], []
+    while not until():
+        scheduled = time.perf_counter() + INTERVAL
+        await asyncio.sleep(INTERVAL)
+        started = time.perf_counter()
+        lags.append(started - scheduled)
+        await handler(db, tasks)
+        latencies.append(time.perf_counter() - started)
+    return latencies, lags
+
+
+def percentiles(values):
+    # inclusive: never extrapolate past the slowest sample
+    quantiles = statistics.quantiles(values, n=100, method="inclusive")
+    return quantiles[49], quantiles[98], max(values)
+
+
+async def measure(size_mb, tmp):
+    from config import get_config
+    from utils.db import backup, db
+
+    await db.db_init()
+    started = time.perf_counter()
+    tasks = await asyncio.to_thread(fill, get_config().db_file, size_mb)
+    fill_s = time.perf_counter() - started
+
+    deadline = time.perf_counter() + BASELINE_SECONDS
+    baseline = await probe(db, tasks, lambda: time.perf_counter() > deadline)
+
+    backup_task = asyncio.create_task(backup.create_backup())
+    during = await probe(db, tasks, backup_task.done)
+    path, size, backup_s = await backup_task
+
+    started = time.perf_counter()
+    await asyncio.to_thread(backup.restore_backup, path, os.path.join(tmp, "r.db"))
+    restore_s = time.perf_counter() - started
+    return tasks, fill_s, baseline, during, size, backup_s, restore_s
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.setdefault("TOKEN", "123456:placeholder")
+        os.environ.setdefault(
+            "FERNET_KEY", "ZmDfcTF7_60GrrY167zsiPd67pEvs0aGOv2oasOM1Pg="
+        )
+        os.environ["DB_FILENAME"] = os.path.join(tmp, "bench.db")
+        os.environ["BACKUP_DIR"] = os.path.join(tmp, "backups")
+        sys.path.insert(0, ROOT)
+
+        tasks, fill_s, baseline, during, size, backup_s, restore_s = asyncio.run(
+            measure(size_mb, tmp)
+        )
+        db_size = os.path.getsize(os.environ["DB_FILENAME"])
+
+    print(f"database:       {db_size / 2**20:8.0f} MiB, {tasks} tasks")
+    print(f"fill:           {fill_s:8.1f} s")
+    print(
+        f"backup:         {backup_s:8.1f} s, {db_size / 2**20 / backup_s:.0f} MiB/s,"
+        f" {size / 2**20:.0f} MiB ({size / db_size:.0%})"
+    )
+    print(f"restore:        {restore_s:8.1f} s")
+    for name, (latencies, lags) in (("idle", baseline), ("during backup", during)):
+        p50, p99, worst = (value * 1000 for value in percentiles(latencies))
+        lag = percentiles(lags)[1] * 1000
+        print(
+            f"handler {name + ':':15} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms"
+            f"  max {worst:7.2f} ms  loop lag p99 {lag:6.2f} ms"
+            f"  ({len(latencies)} calls)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Cold import and startup time of the bot.
+
+Run from the repository root: ``python benchmarks/boot_time.py [runs]``.
+No Telegram connection is made; TOKEN may be a placeholder.
+"""
+
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import main
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def measure_import(env):
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+async def measure_startup():
+    import main
+
+    started = time.perf_counter()
+    await main.on_startup()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.setdefault("TOKEN", "123456:placeholder")
+        env.setdefault("FERNET_KEY", "ZmDfcTF7_60GrrY167zsiPd67pEvs0aGOv2oasOM1Pg=")
+        env["DB_FILENAME"] = os.path.join(tmp, "bench.db")
+        os.environ.update(env)
+        sys.path.insert(0, ROOT)
+
+        imports = [measure_import(env) for _ in range(runs)]
+        startup = asyncio.run(measure_startup())
+
+    from config import get_config
+
+    target_ms = get_config().boot_target_ms
+    import_ms = statistics.median(imports)
+    total_ms = import_ms + startup
+    print(f"import_ms    {import_ms:8.1f}  (median of {runs})")
+    print(f"startup_ms   {startup:8.1f}  (cold database)")
+    print(f"boot_ms      {total_ms:8.1f}")
+    print(f"target_ms    {target_ms:8d}  {'OK' if total_ms <= target_ms else 'OVER'}")
+
+
+if __name__ == "__main__":
+    main()
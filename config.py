@@ -0,0 +1,116 @@
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+
+class ConfigError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Config:
+    """Settings read from the environment (and .env); defaults in brackets.
+
+    TOKEN                required
+    DB_FILENAME          SQLite database file [bot.db]
+    DB_CLEAR_PERIOD      seconds between task clean-ups [86400]
+    FERNET_KEY           storage key; a new one is generated and printed if unset
+    SEARCH_KEY           search index key [derived from FERNET_KEY]
+    STORAGE_ENCODING     compact | text [compact]
+    COMPRESS_MIN_LENGTH  compress payloads from this many bytes [256]
+    QUOTA_MAX_ROWS       tasks and notifications per user [1000]
+    QUOTA_MAX_BYTES      encrypted bytes per user [1048576]
+    DB_BACKEND           sqlite | postgres [sqlite]
+    DATABASE_URL         required for postgres
+    DB_POOL_MIN          postgres pool size [1]
+    DB_POOL_MAX          [10]
+    BOOT_TARGET_MS       boot time above which a warning is logged [2000]
+    SHUTDOWN_TIMEOUT     seconds for a graceful shutdown [20]
+    BACKUP_DIR           [backups]
+    BACKUP_PERIOD        seconds between backups, 0 disables [86400]
+    BACKUP_KEEP          backups kept [7]
+    """
+
+    token: str
+    db_file: str
+    db_clear_period: int
+    fernet_key: str | None
+    search_key: str | None
+    storage_encoding: str
+    compress_min_length: int
+    quota_max_rows: int
+    quota_max_bytes: int
+    db_backend: str
+    database_url: str | None
+    db_pool_min: int
+    db_pool_max: int
+    boot_target_ms: int
+    shutdown_timeout: int
+    backup_dir: str
+    backup_period: int
+    backup_keep: int
+
+
+def _int_env(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ConfigError(f"{name} must be an integer, got {value!r}") from None
+
+
+@lru_cache(maxsize=None)
+def get_config():
+    """Load .env and validate the environment once; later calls are free."""
+    load_dotenv()
+
+    token = os.getenv("TOKEN")
+    if not token:
+        raise ConfigError("TOKEN is not set")
+
+    db_clear_period = _int_env("DB_CLEAR_PERIOD", 24 * 60 * 60)
+    if db_clear_period <= 0:
+        raise ConfigError("DB_CLEAR_PERIOD must be positive")
+
+    storage_encoding = os.getenv("STORAGE_ENCODING") or "compact"
+    if storage_encoding not in ("compact", "text"):
+        raise ConfigError("STORAGE_ENCODING must be 'compact' or 'text'")
+
+    db_backend = os.getenv("DB_BACKEND") or "sqlite"
+    if db_backend not in ("sqlite", "postgres"):
+        raise ConfigError("DB_BACKEND must be 'sqlite' or 'postgres'")
+    database_url = os.getenv("DATABASE_URL") or None
+    if db_backend == "postgres" and not database_url:
+        raise ConfigError("DATABASE_URL is required for DB_BACKEND=postgres")
+
+    backup_period = _int_env("BACKUP_PERIOD", 24 * 60 * 60)
+    if backup_period < 0:
+        raise ConfigError("BACKUP_PERIOD must not be negative")
+    backup_keep = _int_env("BACKUP_KEEP", 7)
+    if backup_keep <= 0:
+        raise ConfigError("BACKUP_KEEP must be positive")
+
+    return Config(
+        token=token,
+        db_file=os.getenv("DB_FILENAME") or "bot.db",
+        db_clear_period=db_clear_period,
+        fernet_key=os.getenv("FERNET_KEY") or None,
+        search_key=os.getenv("SEARCH_KEY") or None,
+        storage_encoding=storage_encoding,
+        compress_min_length=_int_env("COMPRESS_MIN_LENGTH", 256),
+        quota_max_rows=_int_env("QUOTA_MAX_ROWS", 1000),
+        quota_max_bytes=_int_env("QUOTA_MAX_BYTES", 1024 * 1024),
+        db_backend=db_backend,
+        database_url=database_url,
+        db_pool_min=_int_env("DB_POOL_MIN", 1),
+        db_pool_max=_int_env("DB_POOL_MAX", 10),
+        boot_target_ms=_int_env("BOOT_TARGET_MS", 2000),
+        shutdown_timeout=_int_env("SHUTDOWN_TIMEOUT", 20),
+        backup_dir=os.getenv("BACKUP_DIR") or "backups",
+        backup_period=backup_period,
+        backup_keep=backup_keep,
+    )
@@ -1,356 +1,471 @@
 import asyncio
-import os
+import logging
 import time
 from datetime import datetime, timedelta
+from functools import partial
 
 from aiogram import Bot, Dispatcher
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, CommandObject, ExceptionTypeFilter, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
     CallbackQuery,
+    ErrorEvent,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
-    KeyboardButton,
     Message,
-    ReplyKeyboardMarkup,
 )
-from dotenv import load_dotenv
 from pytz import timezone
 
-from menus import cancel_markup, startMenu
+from config import get_config
+from menus import (
+    DUE_PRESETS,
+    PRIORITY_LABELS,
+    build_menus,
+    cancel_markup,
+    date_presets_menu,
+    format_due,
+    start_menu,
+    task_options_menu,
+    task_title,
+    time_presets_menu,
+)
 from states import MainStates, NotificationStates, ReminderStates, TaskStates
-from utils.db.db import (
-    db_init,
-    disable_notification,
-    get_notifications,
-    get_single_notification,
-    get_single_task,
-    get_tasks,
-    get_user_settings,
-    insert_notification,
-    insert_task,
-    notification_scheduler,
-    reminder_scheduler,
-    set_task_name,
-    task_deletion_scheduler,
-    toggle_description_optional,
-    toggle_reminder_optional,
-    update_notification,
-    update_reminder_time,
-    update_task_status,
+from utils.db.backend import storage
+from utils.db.crypto import get_fernet
+from utils.db.db import QuotaExceeded
+from utils.db.search import MIN_TOKEN_LENGTH, ignored_words
+from utils.db.settings_cache import settings
+from utils.dynamic_keyboard import build_settings_menus, generate_settings_menu
+from utils.i18n import I18nMiddleware, button, get_i18n
+from utils.message_packer import pack_rows
+from utils.lifecycle import Lifecycle, cancel_and_wait
+from utils.middlewares import (
+    DeduplicationMiddleware,
+    InFlightMiddleware,
+    ThrottlingMiddleware,
+    WorkMiddleware,
+)
+from utils.periodic import PeriodicScheduler
+from utils.schedulers import (
+    backup_database,
+    clear_database,
+    deliver_outbox,
+    send_notifications,
+    send_reminders,
 )
-from utils.dynamic_keyboard import generate_settings_menu
+from utils.work import INTERACTIVE, work
+
+dp = Dispatcher(storage=MemoryStorage())
+
+in_flight = InFlightMiddleware()
+dp.update.outer_middleware(in_flight)
+dp.update.outer_middleware(DeduplicationMiddleware())
+throttling = ThrottlingMiddleware()
+# after throttling, so rejected updates never queue for a slot
+interactive = WorkMiddleware(work, INTERACTIVE)
+i18n_middleware = I18nMiddleware()
+for observer in (dp.message, dp.callback_query):
+    observer.outer_middleware(throttling)
+    observer.outer_middleware(interactive)
+    observer.outer_middleware(i18n_middleware)
+
+
+def button_key(message):
+    return get_i18n().key_of(message.text)
 
-load_dotenv()
 
+def task_choice(callback_query, choices):
+    """Task id and value of ``task_<field>_<id>_<value>`` callback data.
 
-# _ = setup_locales(locale="ru")
+    Callback data comes from the client, so anything that is not one of
+    ``choices`` gives None."""
+    parts = callback_query.data.split("_")
+    if len(parts) != 4 or not parts[2].isdigit() or parts[3] not in choices:
+        return None
+    return parts[2], parts[3]
 
-# bot init
-bot = Bot(token=os.getenv("TOKEN"))
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+
+PRIORITY_CHOICES = {str(priority) for priority in PRIORITY_LABELS}
+DUE_CHOICES = {str(days) for _label, days in DUE_PRESETS} | {"none"}
+
+
+def task_row(task, _):
+    task_id, task_name, task_description, status, priority, due_at = task
+    task_button = InlineKeyboardButton(
+        text=task_title(task_name, priority, due_at),
+        callback_data=f"view_task_{task_id}",
+    )
+    edit_button = InlineKeyboardButton(
+        text=_("edit_button"), callback_data=f"edit_task_{task_id}"
+    )
+    complete_button = InlineKeyboardButton(
+        text=_("complete_button"), callback_data=f"complete_task_{task_id}"
+    )
+    return [task_button, edit_button, complete_button]
 
 
 # start
 @dp.message(Command("start"))
-async def start_command(message: Message):
-    await message.answer("Menu:", reply_markup=startMenu)
+async def start_command(message: Message, _, locale):
+    await message.answer(_("menu_title"), reply_markup=start_menu(locale))
 
 
 # settings
 @dp.message(Command("settings"))
-@dp.message(lambda message: message.text == "Settings ⚙️")
-async def show_settings(message: Message):
-    settings_menu = await generate_settings_menu(message.from_user.id)
-    await message.answer("Settings:", reply_markup=settings_menu)
+@dp.message(button("settings_button"))
+async def show_settings(message: Message, _, locale):
+    settings_menu = await generate_settings_menu(message.from_user.id, locale)
+    await message.answer(_("settings"), reply_markup=settings_menu)
 
 
 @dp.message(Command("back"))
-@dp.message(lambda message: message.text == "Back 🔙")
-async def go_back_to_main_menu(message: Message):
-    await message.answer("Menu:", reply_markup=startMenu)
+@dp.message(button("back_button"))
+async def go_back_to_main_menu(message: Message, _, locale):
+    await message.answer(_("menu_title"), reply_markup=start_menu(locale))
 
 
-@dp.message(
-    lambda message: message.text
-    in ["Turn on tasks descriptions 📖", "Turn off tasks descriptions 📖"]
-)
-async def toggle_description(message: Message):
-    new_setting = await toggle_description_optional(message.from_user.id)
-    status = "OFF" if new_setting == 1 else "ON"
-    await message.answer(f"Descriptions are {status} now.")
+@dp.message(button("turn_on_descriptions", "turn_off_descriptions"))
+async def toggle_description(message: Message, _, locale):
+    new_setting = await settings.toggle_description_optional(message.from_user.id)
+    status = _("off") if new_setting == 1 else _("on")
+    await message.answer(f"{_('description_status')} {status}")
 
-    settings_menu = await generate_settings_menu(message.from_user.id)
-    await message.answer("Settings:", reply_markup=settings_menu)
+    settings_menu = await generate_settings_menu(message.from_user.id, locale)
+    await message.answer(_("settings"), reply_markup=settings_menu)
 
 
-@dp.message(
-    lambda message: message.text
-    in ["Turn on tasks reminder ⏰", "Turn off tasks reminder ⏰"]
-)
-async def toggle_reminder(message: Message, state: FSMContext):
-    new_setting = await toggle_reminder_optional(message.from_user.id)
-    status = "ON" if new_setting == 1 else "OFF"
-    await message.answer(f"Reminder is {status} now.")
+@dp.message(button("turn_on_reminder", "turn_off_reminder"))
+async def toggle_reminder(message: Message, state: FSMContext, _, locale):
+    new_setting = await settings.toggle_reminder_optional(message.from_user.id)
+    status = _("on") if new_setting == 1 else _("off")
+    await message.answer(f"{_('reminder_status')} {status}")
 
-    settings_menu = await generate_settings_menu(message.from_user.id)
-    await message.answer("Settings:", reply_markup=settings_menu)
+    settings_menu = await generate_settings_menu(message.from_user.id, locale)
+    await message.answer(_("settings"), reply_markup=settings_menu)
 
     if new_setting == 1:
-        await message.answer("Please send reminder time (HH:MM, Moscow time).")
+        await message.answer(_("send_reminder_time"))
         await state.set_state(ReminderStates.waiting_for_reminder_time)
 
 
+@dp.message(Command("language"))
+@dp.message(button("language_button"))
+async def switch_language(message: Message, locale):
+    i18n = get_i18n()
+    locales = i18n.locales
+    new_locale = locales[(locales.index(locale) + 1) % len(locales)]
+
+    await storage.set_user_language(message.from_user.id, new_locale)
+    i18n.remember(message.from_user.id, new_locale)
+
+    _ = i18n.translator(new_locale)
+    settings_menu = await generate_settings_menu(message.from_user.id, new_locale)
+    await message.answer(_("language_changed"), reply_markup=settings_menu)
+
+
 @dp.message(ReminderStates.waiting_for_reminder_time)
-async def set_reminder_time(message: Message, state: FSMContext):
+async def set_reminder_time(message: Message, state: FSMContext, _):
     reminder_time = message.text
 
     # time validation
     try:
         time.strptime(reminder_time, "%H:%M")
     except ValueError:
-        await message.answer("Invalid format. Please send in HH:MM format.")
+        await message.answer(_("invalid_time_format"))
         return
 
-    await update_reminder_time(message.from_user.id, reminder_time)
-    await message.answer(f"Reminder set for {reminder_time} daily.")
+    await settings.update_reminder_time(message.from_user.id, reminder_time)
+    await message.answer(f"{_('reminder_set')} {reminder_time}")
     await state.set_state(MainStates.main_state)
 
 
 # add task
 @dp.message(Command("add_task"))
-@dp.message(lambda message: message.text == "Add task ➕")
-async def init_add_task(message: Message, state: FSMContext):
+@dp.message(button("add_task_button"))
+async def init_add_task(message: Message, state: FSMContext, _, locale):
     await state.set_state(MainStates.main_state)
-    await message.answer("Send me the task!", reply_markup=cancel_markup)
+    await message.answer(_("send_task_name"), reply_markup=cancel_markup(locale))
     await state.set_state(TaskStates.waiting_for_task_name)
 
 
 # KB complete
 @dp.message(Command("complete"), StateFilter(MainStates.main_state))
-async def kb_complete_task(message: Message):
+async def kb_complete_task(message: Message, _):
     # Get task_id from command arguments
     try:
         task_id = message.text.split()[1]
     except IndexError:
-        await message.answer("Task not found.")
+        await message.answer(_("task_not_found"))
         return
 
-    task = await get_single_task(task_id)
+    task = await storage.toggle_task_status(message.from_user.id, task_id)
 
     if task:
-        task_name, _desc, current_status = task
-        new_status = 1 if current_status == 0 else 0
-        await update_task_status(task_id, new_status)
+        task_name, new_status = task
+        status = _("completed") if new_status == 1 else _("incomplete")
         await message.edit_reply_markup(reply_markup=None)
         await message.answer(
-            f""""Task '{task_name}' marked as {'completed' if new_status == 1 
-                                               else 'incomplete'}."""
+            _("task_status_changed").format(name=task_name, status=status.strip())
         )
 
     else:
-        await message.answer("Task not found.")
+        await message.answer(_("task_not_found"))
 
 
 @dp.message(TaskStates.waiting_for_task_name)
-async def add_task_name(message: Message, state: FSMContext):
+async def add_task_name(message: Message, state: FSMContext, _, locale):
     await state.update_data(task_name=message.text)
-    user_settings = await get_user_settings(message.from_user.id)
+    user_settings = await settings.get_user_settings(message.from_user.id)
     description_optional = user_settings["description_optional"]
 
     if description_optional:
-        await insert_task(message.from_user.id, message.text, "")
-        await message.answer("Task added successfully!", reply_markup=startMenu)
+        await storage.insert_task(message.from_user.id, message.text, "")
+        await message.answer(
+            _("task_added_success"), reply_markup=start_menu(locale)
+        )
         await state.set_state(MainStates.main_state)
     else:
-        await message.answer("Now send me description!", reply_markup=cancel_markup)
+        await message.answer(
+            _("send_task_description"), reply_markup=cancel_markup(locale)
+        )
         await state.set_state(TaskStates.waiting_for_task_description)
 
 
 @dp.message(TaskStates.waiting_for_task_description)
-async def add_task_description(message: Message, state: FSMContext):
+async def add_task_description(message: Message, state: FSMContext, _, locale):
     data = await state.get_data()
-    await insert_task(message.from_user.id, data["task_name"], message.text)
-    await message.answer("Task added successfully!", reply_markup=startMenu)
+    await storage.insert_task(message.from_user.id, data["task_name"], message.text)
+    await message.answer(_("task_added_success"), reply_markup=start_menu(locale))
     await state.set_state(MainStates.main_state)
 
 
 # view task - displays task name and description (or placeholder if empty)
 @dp.message(Command("show_tasks"))
-@dp.message(lambda message: message.text == "Show tasks 📋")
-async def show_tasks(message: Message):
-    tasks = await get_tasks(message.from_user.id)
-    if not tasks:
-        await message.answer("You have no tasks yet.")
+@dp.message(button("show_tasks_button"))
+async def show_tasks(message: Message, _):
+    rows = (
+        task_row(task, _) async for task in storage.iter_tasks(message.from_user.id)
+    )
+    sent = False
+    async for inline_keyboard in pack_rows(rows):
+        keyboard = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+        title = _("your_tasks_continued") if sent else _("your_tasks")
+        await message.answer(title, reply_markup=keyboard)
+        sent = True
+
+    if not sent:
+        await message.answer(_("no_tasks"))
+
+
+@dp.message(Command("search"))
+async def search(message: Message, command: CommandObject, _):
+    if not command.args:
+        await message.answer(_("search_usage"))
         return
 
-    inline_keyboard = []
-    for task in tasks:
-        task_id, task_name, task_description, status = task
-        task_button = InlineKeyboardButton(
-            text=f"{task_name}", callback_data=f"view_task_{task_id}"
-        )
-        edit_button = InlineKeyboardButton(
-            text="✏️ Edit", callback_data=f"edit_task_{task_id}"
-        )
-        complete_button = InlineKeyboardButton(
-            text="✅ Complete", callback_data=f"complete_task_{task_id}"
+    ignored = ignored_words(command.args)
+    if ignored:
+        await message.answer(
+            _("search_ignored_words").format(
+                length=MIN_TOKEN_LENGTH, words=", ".join(ignored)
+            )
         )
-        inline_keyboard.append([task_button, edit_button, complete_button])
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
-    await message.answer("Your tasks:", reply_markup=keyboard)
+    tasks = await storage.search_tasks(message.from_user.id, command.args)
+
+    async def rows():
+        for task in tasks:
+            yield task_row(task, _)
+
+    sent = False
+    async for inline_keyboard in pack_rows(rows()):
+        keyboard = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+        await message.answer(_("search_results"), reply_markup=keyboard)
+        sent = True
+
+    if not sent:
+        await message.answer(_("search_no_results"))
 
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("edit_task_"))
-async def edit_task(callback_query: CallbackQuery, state: FSMContext):
+async def edit_task(callback_query: CallbackQuery, state: FSMContext, _):
     task_id = callback_query.data.split("_")[2]
-    task = await get_single_task(task_id)
+    task = await storage.get_single_task(task_id)
 
     if task:
         await state.update_data(task_id=task_id)
         await callback_query.message.answer(
-            f"Current task name: {task[0]}\nPlease send a new task name."
+            f"{_('current_task_name')} {task[0]}\n{_('send_new_task_name')}"
         )
         await state.set_state(TaskStates.waiting_for_task_edit)
     else:
-        await callback_query.message.answer("Task not found.")
+        await callback_query.message.answer(_("task_not_found"))
     await callback_query.answer()
 
 
 @dp.message(TaskStates.waiting_for_task_edit)
-async def save_edited_task(message: Message, state: FSMContext):
+async def save_edited_task(message: Message, state: FSMContext, _):
     data = await state.get_data()
     task_id = data["task_id"]
     new_task_name = message.text
 
-    await set_task_name(task_id, new_task_name)
-    await message.answer(f"Task updated to: {new_task_name}")
+    await storage.set_task_name(task_id, new_task_name)
+    await message.answer(f"{_('task_updated')} {new_task_name}")
     await state.set_state(MainStates.main_state)
 
 
 # complete task - marks task as complete/incomplete and updates button status
 @dp.callback_query(lambda c: c.data and c.data.startswith("complete_task_"))
-async def complete_task(callback_query: CallbackQuery):
+async def complete_task(callback_query: CallbackQuery, _):
     task_id = callback_query.data.split("_")[2]
-    task = await get_single_task(task_id)
+    # the list only shows incomplete tasks, so the button means "0 -> 1"
+    result = await storage.set_task_status(callback_query.from_user.id, task_id, 0, 1)
 
-    if task:
-        task_name, _desc, current_status = task
-        new_status = 1 if current_status == 0 else 0
-        await update_task_status(task_id, new_status)
+    if result is None:
+        await callback_query.answer(_("task_not_found"))
+    elif result[0] is None:
+        await callback_query.answer(_("task_already_completed"))
+    else:
+        status = _("completed").strip()
         await callback_query.message.edit_reply_markup(reply_markup=None)
         await callback_query.message.answer(
-            f"""Task '{task_name}' marked as {'completed' if new_status == 1 else 
-                                            'incomplete'}."""
+            _("task_status_changed").format(name=result[0], status=status)
         )
-    else:
-        await callback_query.answer("Task not found.")
+        await callback_query.answer()
 
 
 # from here
 @dp.callback_query(lambda c: c.data and c.data.startswith("view_task_"))
-async def view_task(callback_query):
+async def view_task(callback_query, _, locale):
     task_id = callback_query.data.split("_")[2]
-    task = await get_single_task(task_id)
+    task = await storage.get_single_task(task_id)
     if task:
-        name, description, _status = task
-        await callback_query.message.answer(f"{name}\n{description}\n")
+        name, description, _status, priority, due_at = task
+        due = format_due(due_at) if due_at else _("due_none")
+        await callback_query.message.answer(
+            f"{name}\n{description}\n"
+            f"{_('task_priority_label')} {_(PRIORITY_LABELS[priority])}\n"
+            f"{_('task_due_label')} {due}",
+            reply_markup=task_options_menu(locale, task_id),
+        )
     else:
-        await callback_query.message.answer("Task not found.")
+        await callback_query.message.answer(_("task_not_found"))
     await callback_query.answer()
 
 
+@dp.callback_query(lambda c: c.data and c.data.startswith("task_priority_"))
+async def set_task_priority(callback_query: CallbackQuery, _):
+    choice = task_choice(callback_query, PRIORITY_CHOICES)
+    if choice is None:
+        await callback_query.answer(_("task_not_found"))
+        return
+    task_id, priority = choice
+    priority = int(priority)
+    task_name = await storage.set_task_priority(
+        callback_query.from_user.id, task_id, priority
+    )
+    if task_name:
+        await callback_query.message.answer(
+            _("task_priority_changed").format(
+                name=task_name, priority=_(PRIORITY_LABELS[priority])
+            )
+        )
+        await callback_query.answer()
+    else:
+        await callback_query.answer(_("task_not_found"))
+
+
+@dp.callback_query(lambda c: c.data and c.data.startswith("task_due_"))
+async def set_task_due_date(callback_query: CallbackQuery, _):
+    choice = task_choice(callback_query, DUE_CHOICES)
+    if choice is None:
+        await callback_query.answer(_("task_not_found"))
+        return
+    task_id, days = choice
+    due_at = None
+    if days != "none":
+        today = datetime.now(timezone("Europe/Moscow")).date()
+        due_at = (today + timedelta(days=int(days))).isoformat()
+
+    task_name = await storage.set_task_due_date(
+        callback_query.from_user.id, task_id, due_at
+    )
+    if task_name:
+        due = format_due(due_at) if due_at else _("due_none")
+        await callback_query.message.answer(
+            _("task_due_changed").format(name=task_name, date=due)
+        )
+        await callback_query.answer()
+    else:
+        await callback_query.answer(_("task_not_found"))
+
+
 # Notifications
-@dp.message(lambda message: message.text == "Add notification ⏰")
-async def init_add_notification(message: Message, state: FSMContext):
+@dp.message(button("add_notification_button"))
+async def init_add_notification(message: Message, state: FSMContext, _, locale):
     await state.set_state(MainStates.main_state)
-    await message.answer("Send me the notification name.", reply_markup=cancel_markup)
+    await message.answer(
+        _("send_notification_name"), reply_markup=cancel_markup(locale)
+    )
     await state.set_state(NotificationStates.waiting_for_notification_name)
 
 
 @dp.message(NotificationStates.waiting_for_notification_name)
-async def set_notification_name(message: Message, state: FSMContext):
+async def set_notification_name(message: Message, state: FSMContext, _, locale):
     notification_name = message.text
     await state.update_data(notification_name=notification_name)
 
     await message.answer(
-        "Please send me the time in HH:MM format or choose one of the presets:",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[
-                [
-                    KeyboardButton(text="In 1 hour"),
-                    KeyboardButton(text="10:00"),
-                    KeyboardButton(text="14:00"),
-                    KeyboardButton(text="18:00"),
-                ],
-                [KeyboardButton(text="Отмена 🛇")],
-            ],
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        ),
+        _("send_notification_time"), reply_markup=time_presets_menu(locale)
     )
     await state.set_state(NotificationStates.waiting_for_notification_time)
 
 
 @dp.message(NotificationStates.waiting_for_notification_time)
-async def set_notification_time(message: Message, state: FSMContext):
+async def set_notification_time(message: Message, state: FSMContext, _, locale):
     data = await state.get_data()
-    if message.text.lower() == "in 1 hour":
+    key = button_key(message)
+    if key == "preset_in_1_hour":
         notification_time = (datetime.now() + timedelta(hours=1)).strftime("%H:%M")
         notification_date = (datetime.now() + timedelta(hours=1)).strftime("%d.%m.%Y")
         await state.update_data(
             notification_time=notification_time, notification_date=notification_date
         )
-        await insert_notification(
+        await storage.insert_notification(
             message.from_user.id,
             data["notification_name"],
             notification_date,
             notification_time,
         )
         await message.answer(
-            f"Reminder '{data['notification_name']}' set for {notification_date}"
-            f" at {notification_time}",
-            reply_markup=startMenu,
+            f"{_('notification_set')} {notification_date}"
+            f" {_('at')} {notification_time}",
+            reply_markup=start_menu(locale),
         )
         await state.set_state(MainStates.main_state)
-    elif message.text.lower() == "отмена 🛇":
+    elif key == "cancel_button":
         await state.set_state(MainStates.main_state)
-        await message.answer("Cancelled!", reply_markup=startMenu)
+        await message.answer(_("cancelled"), reply_markup=start_menu(locale))
     else:
         try:
             time_object = time.strptime(message.text, "%H:%M")
             notification_time = time.strftime("%H:%M", time_object)
             await state.update_data(notification_time=notification_time)
             await message.answer(
-                "Please send me the date in DD.MM format or choose from presets:",
-                reply_markup=ReplyKeyboardMarkup(
-                    keyboard=[
-                        [
-                            KeyboardButton(text="Tomorrow"),
-                            KeyboardButton(text="In 3 days"),
-                            KeyboardButton(text="Next week"),
-                        ],
-                        [KeyboardButton(text="Отмена 🛇")],
-                    ],
-                    resize_keyboard=True,
-                    one_time_keyboard=True,
-                ),
+                _("send_notification_date"), reply_markup=date_presets_menu(locale)
             )
             await state.set_state(NotificationStates.waiting_for_notification_date)
         except ValueError:
-            await message.answer(
-                "Invalid time format. Please enter in HH:MM format or choose a preset."
-            )
+            await message.answer(_("invalid_time_format"))
 
 
 @dp.message(NotificationStates.waiting_for_notification_date)
-async def set_notification_date(message: Message, state: FSMContext):
-    if message.text.lower() == "отмена 🛇":
+async def set_notification_date(message: Message, state: FSMContext, _, locale):
+    key = button_key(message)
+    if key == "cancel_button":
         await state.set_state(MainStates.main_state)
-        await message.answer("Cancelled!", reply_markup=startMenu)
+        await message.answer(_("cancelled"), reply_markup=start_menu(locale))
         return
 
     moscow_tz = timezone("Europe/Moscow")
@@ -359,11 +474,11 @@ async def set_notification_date(message: Message, state: FSMContext):
     data = await state.get_data()
     reminder_time = data.get("notification_time", "00:00")
 
-    if message.text.lower() == "tomorrow":
+    if key == "preset_tomorrow":
         notification_date = (now + timedelta(days=1)).strftime("%d.%m.%Y")
-    elif message.text.lower() == "in 3 days":
+    elif key == "preset_in_3_days":
         notification_date = (now + timedelta(days=3)).strftime("%d.%m.%Y")
-    elif message.text.lower() == "next week":
+    elif key == "preset_next_week":
         notification_date = (now + timedelta(days=7)).strftime("%d.%m.%Y")
     else:
         try:
@@ -378,14 +493,12 @@ async def set_notification_date(message: Message, state: FSMContext):
 
             notification_date = input_date.strftime("%d.%m.%Y")
         except ValueError:
-            await message.answer(
-                "Invalid date format. Please enter in DD.MM format or choose a preset."
-            )
+            await message.answer(_("invalid_date_format"))
             return
 
     await state.update_data(notification_date=notification_date)
     data = await state.get_data()
-    await insert_notification(
+    await storage.insert_notification(
         message.from_user.id,
         data["notification_name"],
         notification_date,
@@ -394,20 +507,20 @@ async def set_notification_date(message: Message, state: FSMContext):
 
     await message.answer(
         (
-            f"Reminder '{data['notification_name']}' set for {notification_date} "
-            f"at {data['notification_time']}"
+            f"{_('notification_set')} {notification_date} "
+            f"{_('at')} {data['notification_time']}"
         ).strip(),
-        reply_markup=startMenu,
+        reply_markup=start_menu(locale),
     )
     await state.set_state(MainStates.main_state)
 
 
-@dp.message(lambda message: message.text == "Show notifications 📅")
-async def show_notifications(message: Message):
-    notifications = await get_notifications(message.from_user.id)
+@dp.message(button("show_notifications_button"))
+async def show_notifications(message: Message, _):
+    notifications = await storage.get_notifications(message.from_user.id)
 
     if not notifications:
-        await message.answer("You have no active notifications.")
+        await message.answer(_("no_notifications"))
         return
 
     inline_keyboard = []
@@ -415,10 +528,10 @@ async def show_notifications(message: Message):
         notification_id, name, date, time = notification
 
         edit_button = InlineKeyboardButton(
-            text="✏️ Edit", callback_data=f"edit_notification_{notification_id}"
+            text=_("edit_button"), callback_data=f"edit_notification_{notification_id}"
         )
         complete_button = InlineKeyboardButton(
-            text="✅ Complete",
+            text=_("complete_button"),
             callback_data=f"complete_notification_{notification_id}",
         )
 
@@ -431,79 +544,70 @@ async def show_notifications(message: Message):
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
 
-    await message.answer("Your notifications:", reply_markup=keyboard)
+    await message.answer(_("your_notifications"), reply_markup=keyboard)
 
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("view_notification_"))
-async def view_notification(callback_query):
+async def view_notification(callback_query, _):
     notification_id = callback_query.data.split("_")[2]
-    notification = await get_single_notification(notification_id)
+    notification = await storage.get_single_notification(notification_id)
 
     if notification:
         name, date, time = notification
         await callback_query.message.answer(f"{name}\n{date}\n{time}")
     else:
-        await callback_query.message.answer("Notification not found.")
+        await callback_query.message.answer(_("notification_not_found"))
 
     await callback_query.answer()
 
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("complete_notification_"))
-async def complete_notification(callback_query: CallbackQuery):
+async def complete_notification(callback_query: CallbackQuery, _):
     notification_id = callback_query.data.split("_")[2]
-    notification = await get_single_notification(notification_id)
+    notification = await storage.get_single_notification(notification_id)
 
     if notification:
-        await disable_notification(notification_id)
-        await callback_query.message.answer("Notification completed.")
+        await storage.disable_notification(notification_id)
+        await callback_query.message.answer(_("notification_completed"))
     else:
-        await callback_query.message.answer("Notification not found.")
+        await callback_query.message.answer(_("notification_not_found"))
 
     await callback_query.answer()
 
 
 @dp.callback_query(lambda c: c.data and c.data.startswith("edit_notification_"))
-async def edit_notification(callback_query, state: FSMContext):
+async def edit_notification(callback_query, state: FSMContext, _, locale):
     notification_id = callback_query.data.split("_")[2]
-    notification = await get_single_notification(notification_id)
+    notification = await storage.get_single_notification(notification_id)
 
     if notification:
         await state.update_data(notification_id=notification_id)
         await callback_query.message.answer(
-            f"Current notification name: {notification[0]}\n"
-            "Please send me the new date in DD.MM format or choose from presets:",
-            reply_markup=ReplyKeyboardMarkup(
-                keyboard=[
-                    [
-                        KeyboardButton(text="Tomorrow"),
-                        KeyboardButton(text="In 3 days"),
-                        KeyboardButton(text="Next week"),
-                    ]
-                ],
-                resize_keyboard=True,
-                one_time_keyboard=True,
-            ),
+            f"{_('current_notification_name')} {notification[0]}\n"
+            f"{_('send_notification_new_time')}",
+            reply_markup=date_presets_menu(locale),
         )
         await state.set_state(NotificationStates.waiting_for_notification_edit_date)
     else:
-        await callback_query.message.answer("Notification not found.")
+        await callback_query.message.answer(_("notification_not_found"))
     await callback_query.answer()
 
 
 @dp.message(NotificationStates.waiting_for_notification_edit_date)
-async def edit_notification_date(message: Message, state: FSMContext):
-    if message.text.lower() == "отмена 🛇":
+async def edit_notification_date(message: Message, state: FSMContext, _, locale):
+    key = button_key(message)
+    if key == "cancel_button":
         await state.set_state(MainStates.main_state)
-        await message.answer("Cancelled!", reply_markup=startMenu)
+        await message.answer(_("cancelled"), reply_markup=start_menu(locale))
         return
 
     now = datetime.now(timezone("Europe/Moscow"))
 
-    if message.text.lower() == "tomorrow":
+    if key == "preset_tomorrow":
         notification_date = (now + timedelta(days=1)).strftime("%d.%m.%Y")
-    elif message.text.lower() == "in 3 days":
+    elif key == "preset_in_3_days":
         notification_date = (now + timedelta(days=3)).strftime("%d.%m.%Y")
-    elif message.text.lower() == "next week":
+    elif key == "preset_next_week":
         notification_date = (now + timedelta(days=7)).strftime("%d.%m.%Y")
     else:
         try:
@@ -514,76 +618,168 @@ async def edit_notification_date(message: Message, state: FSMContext):
                 notification_date = notification_date.replace(year=now.year + 1)
             notification_date = notification_date.strftime("%d.%m.%Y")
         except ValueError:
-            await message.answer(
-                "Invalid date format. Please enter in DD.MM format or choose a preset."
-            )
+            await message.answer(_("invalid_date_format"))
             return
 
     await state.update_data(notification_date=notification_date)
     await message.answer(
-        "Please send me the new time in HH:MM format or choose one of the presets:",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[
-                [
-                    KeyboardButton(text="10:00"),
-                    KeyboardButton(text="14:00"),
-                    KeyboardButton(text="18:00"),
-                ]
-            ],
-            resize_keyboard=True,
-            one_time_keyboard=True,
-        ),
+        _("send_notification_time"),
+        reply_markup=time_presets_menu(locale, with_in_1_hour=False),
     )
     await state.set_state(NotificationStates.waiting_for_notification_edit_time)
 
 
 @dp.message(NotificationStates.waiting_for_notification_edit_time)
-async def edit_notification_time(message: Message, state: FSMContext):
-    if message.text.lower() == "отмена 🛇":
+async def edit_notification_time(message: Message, state: FSMContext, _, locale):
+    if button_key(message) == "cancel_button":
         await state.set_state(MainStates.main_state)
-        await message.answer("Cancelled!", reply_markup=startMenu)
+        await message.answer(_("cancelled"), reply_markup=start_menu(locale))
         return
 
     try:
         time_object = time.strptime(message.text, "%H:%M")
         notification_time = time.strftime("%H:%M", time_object)
     except ValueError:
-        await message.answer(
-            "Invalid time format. Please enter in HH:MM format or choose a preset."
-        )
+        await message.answer(_("invalid_time_format"))
         return
 
     data = await state.get_data()
-    await update_notification(
+    await storage.update_notification(
         data["notification_id"], data["notification_date"], notification_time
     )
 
     await message.answer(
-        f"Notification updated to {data['notification_date']} at {notification_time}",
-        reply_markup=startMenu,
+        f"{_('notification_updated')} {data['notification_date']} "
+        f"{_('at')} {notification_time}",
+        reply_markup=start_menu(locale),
     )
     await state.set_state(MainStates.main_state)
 
 
+@dp.error(ExceptionTypeFilter(QuotaExceeded))
+async def quota_exceeded(event: ErrorEvent, state: FSMContext):
+    message = event.update.message
+    i18n = get_i18n()
+    locale = await i18n.locale_for(message.from_user.id)
+    await state.set_state(MainStates.main_state)
+    await message.answer(
+        i18n.gettext("quota_exceeded", locale), reply_markup=start_menu(locale)
+    )
+
+
 @dp.callback_query(lambda c: c.data == "cancel_action")
-async def cancel_action(callback_query: CallbackQuery, state: FSMContext):
+async def cancel_action(callback_query: CallbackQuery, state: FSMContext, _, locale):
     await state.set_state(MainStates.main_state)
-    await callback_query.message.answer("Cancelled!", reply_markup=startMenu)
+    await callback_query.message.answer(
+        _("cancelled"), reply_markup=start_menu(locale)
+    )
     await callback_query.answer()
 
 
+boot_report = {"ready": False}
+
+
+def warm_up_i18n():
+    get_i18n()
+    build_menus()
+    build_settings_menus()
+
+
 async def on_startup():
-    await db_init()
-    print("Database initialized")
+    started = time.perf_counter()
+    get_fernet()
+    # independent steps: schema setup is I/O, catalog loading is CPU-bound
+    await asyncio.gather(storage.init(), asyncio.to_thread(warm_up_i18n))
+    boot_report["startup_ms"] = (time.perf_counter() - started) * 1000
+    logging.info("Database initialized")
+
+
+@dp.startup()
+async def on_ready(boot_started):
+    boot_ms = (time.perf_counter() - boot_started) * 1000
+    target_ms = get_config().boot_target_ms
+    boot_report.update(ready=True, boot_ms=boot_ms, target_ms=target_ms)
+    logging.log(
+        logging.INFO if boot_ms <= target_ms else logging.WARNING,
+        "Ready: boot %.0f ms (startup %.0f ms, target %d ms)",
+        boot_ms,
+        boot_report["startup_ms"],
+        target_ms,
+    )
+
+
+async def migrate_storage():
+    result = await storage.migrate()
+    if result.get("indexed"):
+        logging.info("Search index built for %d tasks", result["indexed"])
+    if result.get("compacted"):
+        logging.info(
+            "Compacted %d rows: %d -> %d payload bytes (%d saved)",
+            result["compacted"],
+            result["bytes_before"],
+            result["bytes_after"],
+            result["bytes_before"] - result["bytes_after"],
+        )
+
+
+async def log_scheduler_health(scheduler, tick):
+    for name, health in scheduler.health().items():
+        logging.info("scheduler %s: %s", name, health)
+    for name, health in work.health().items():
+        logging.info("work %s: %s", name, health)
+
+
+async def save_checkpoints(scheduler, tick=None):
+    await storage.save_checkpoints(scheduler.checkpoints())
 
 
 async def main():
+    boot_started = time.perf_counter()
+    logging.basicConfig(level=logging.INFO)
+    config = get_config()
+    bot = Bot(token=config.token)
     await on_startup()
-    loop = asyncio.get_running_loop()
-    loop.create_task(task_deletion_scheduler())
-    loop.create_task(reminder_scheduler(bot))
-    loop.create_task(notification_scheduler(bot))
-    await dp.start_polling(bot)
+
+    scheduler = PeriodicScheduler()
+    scheduler.add("task_deletion", clear_database, period=config.db_clear_period)
+    scheduler.add("reminders", partial(send_reminders, bot), replay=True)
+    scheduler.add("notifications", partial(send_notifications, bot), replay=True)
+    # retries and anything left over by an earlier run or instance
+    scheduler.add("outbox", partial(deliver_outbox, bot), period=30)
+    scheduler.add("settings_flush", settings.flush, period=5)
+    scheduler.add("checkpoints", partial(save_checkpoints, scheduler))
+    scheduler.add("health", partial(log_scheduler_health, scheduler), period=900)
+    if config.db_backend == "sqlite" and config.backup_period:
+        scheduler.add("backup", backup_database, period=config.backup_period)
+    # reminder and notification ticks missed while the bot was down are
+    # replayed first; every other job starts fresh
+    scheduler.start(await storage.get_checkpoints())
+    # online backfill/conversion of legacy rows; resumes where it stopped
+    migration = asyncio.create_task(migrate_storage())
+
+    async def drain():
+        await asyncio.gather(in_flight.drain(), scheduler.drain())
+
+    # polling stops first, so no new updates arrive while draining; the
+    # session and the database are closed only once nothing uses them
+    lifecycle = Lifecycle(deadline=config.shutdown_timeout)
+    lifecycle.on_shutdown("migration", partial(cancel_and_wait, migration))
+    lifecycle.on_shutdown("in-flight work", drain)
+    lifecycle.on_shutdown("settings", settings.flush)
+    lifecycle.on_shutdown("checkpoints", partial(save_checkpoints, scheduler))
+    lifecycle.on_shutdown("storage", storage.close)
+    lifecycle.on_shutdown("bot session", bot.session.close)
+    lifecycle.install_signal_handlers(dp.stop_polling)
+    try:
+        await dp.start_polling(
+            bot,
+            boot_started=boot_started,
+            handle_signals=False,
+            close_bot_session=False,
+        )
+    finally:
+        await lifecycle.shutdown()
+        await log_scheduler_health(scheduler, None)
 
 
 if __name__ == "__main__":
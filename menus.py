@@ -1,3 +1,6 @@
+from datetime import date
+from functools import lru_cache
+
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -5,26 +8,115 @@ from aiogram.types import (
     InlineKeyboardMarkup,
 )
 
+from utils.db.db import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+from utils.i18n import get_i18n
 
+PRIORITY_LABELS = {
+    PRIORITY_HIGH: "priority_high",
+    PRIORITY_NORMAL: "priority_normal",
+    PRIORITY_LOW: "priority_low",
+}
+PRIORITY_MARKS = {PRIORITY_HIGH: "🔴 ", PRIORITY_LOW: "🟢 "}
+# label, days from today
+DUE_PRESETS = (("due_today", 0), ("preset_tomorrow", 1), ("preset_next_week", 7))
 
-startMenu = ReplyKeyboardMarkup(
-   keyboard=[
-        [
-            KeyboardButton(text="Add task ➕"),
-            KeyboardButton(text="Show tasks 📋"),
-        ],
-        [
-            KeyboardButton(text="Add notification ⏰"),
-            KeyboardButton(text="Show notifications 📅"),
-        ],
-        [
-            KeyboardButton(text="Settings ⚙️"),
+
+# Keyboards only depend on the locale, so each one is built once per locale
+# (see build_menus) and shared by every update afterwards.
+
+
+@lru_cache(maxsize=None)
+def start_menu(locale):
+    _ = get_i18n().translator(locale)
+    return ReplyKeyboardMarkup(
+        keyboard=[
+            [
+                KeyboardButton(text=_("add_task_button")),
+                KeyboardButton(text=_("show_tasks_button")),
+            ],
+            [
+                KeyboardButton(text=_("add_notification_button")),
+                KeyboardButton(text=_("show_notifications_button")),
+            ],
+            [
+                KeyboardButton(text=_("settings_button")),
+            ],
         ],
-    ],
-    resize_keyboard=True,
-    one_time_keyboard=False,
-    input_field_placeholder="Menu",
-)
+        resize_keyboard=True,
+        one_time_keyboard=False,
+        input_field_placeholder=_("menu_placeholder"),
+    )
+
+
+@lru_cache(maxsize=None)
+def cancel_markup(locale):
+    _ = get_i18n().translator(locale)
+    cancel_button = InlineKeyboardButton(
+        text=_("cancel_button"), callback_data="cancel_action"
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[[cancel_button]])
+
+
+def _presets_menu(_, presets, with_cancel):
+    keyboard = [[KeyboardButton(text=_(preset)) for preset in presets]]
+    if with_cancel:
+        keyboard.append([KeyboardButton(text=_("cancel_button"))])
+    return ReplyKeyboardMarkup(
+        keyboard=keyboard, resize_keyboard=True, one_time_keyboard=True
+    )
+
+
+@lru_cache(maxsize=None)
+def time_presets_menu(locale, with_in_1_hour=True):
+    _ = get_i18n().translator(locale)
+    presets = ["10:00", "14:00", "18:00"]
+    if with_in_1_hour:
+        presets.insert(0, "preset_in_1_hour")
+    return _presets_menu(_, presets, with_cancel=True)
+
+
+@lru_cache(maxsize=None)
+def date_presets_menu(locale):
+    _ = get_i18n().translator(locale)
+    presets = ["preset_tomorrow", "preset_in_3_days", "preset_next_week"]
+    return _presets_menu(_, presets, with_cancel=True)
+
+
+def format_due(due_at, date_format="%d.%m.%Y"):
+    return date.fromisoformat(due_at).strftime(date_format)
+
+
+def task_title(name, priority, due_at):
+    title = f"{PRIORITY_MARKS.get(priority, '')}{name}"
+    if due_at:
+        title += f" · {format_due(due_at, '%d.%m')}"
+    return title
+
+
+def task_options_menu(locale, task_id):
+    _ = get_i18n().translator(locale)
+    priority_row = [
+        InlineKeyboardButton(
+            text=_(label), callback_data=f"task_priority_{task_id}_{priority}"
+        )
+        for priority, label in PRIORITY_LABELS.items()
+    ]
+    due_row = [
+        InlineKeyboardButton(text=_(label), callback_data=f"task_due_{task_id}_{days}")
+        for label, days in DUE_PRESETS
+    ]
+    due_row.append(
+        InlineKeyboardButton(
+            text=_("due_none"), callback_data=f"task_due_{task_id}_none"
+        )
+    )
+    return InlineKeyboardMarkup(inline_keyboard=[priority_row, due_row])
+
 
-cancel_button = InlineKeyboardButton(text="Отмена 🛇", callback_data="cancel_action")
-cancel_markup = InlineKeyboardMarkup(inline_keyboard=[[cancel_button]])
+def build_menus():
+    for locale in get_i18n().locales:
+        start_menu(locale)
+        cancel_markup(locale)
+        time_presets_menu(locale)
+        time_presets_menu(locale, with_in_1_hour=False)
+        date_presets_menu(locale)
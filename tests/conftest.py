@@ -0,0 +1,50 @@
+import asyncio
+import inspect
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# never DATABASE_URL, which is the bot's own database: the Postgres leg
+# empties every table of the database it is given
+POSTGRES_URL = os.getenv("TEST_DATABASE_URL")
+
+os.environ.setdefault("TOKEN", "123456:test")
+os.environ.setdefault("FERNET_KEY", "ZmDfcTF7_60GrrY167zsiPd67pEvs0aGOv2oasOM1Pg=")
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """Set environment variables and reload the config from them."""
+    from config import get_config
+
+    def configure(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        get_config.cache_clear()
+
+    yield configure
+    get_config.cache_clear()
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Run ``async def`` tests on the session loop."""
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    loop = pyfuncitem.funcargs["event_loop"]
+    arguments = {
+        name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames
+    }
+    loop.run_until_complete(pyfuncitem.obj(**arguments))
+    return True
@@ -0,0 +1,97 @@
+import sqlite3
+
+import pytest
+
+from utils.db import backup, db
+from utils.db.backup import (
+    FRAME_LENGTH,
+    MAGIC,
+    BackupError,
+    create_backup,
+    list_backups,
+    restore_backup,
+)
+
+
+@pytest.fixture
+def database(tmp_path, configure, monkeypatch, event_loop):
+    db_file = tmp_path / "bot.db"
+    configure(DB_FILENAME=db_file, BACKUP_DIR=tmp_path / "backups", BACKUP_KEEP=2)
+    # small frames, so even a test database spans several of them
+    monkeypatch.setattr(backup, "CHUNK_SIZE", 1024)
+    event_loop.run_until_complete(db.db_init())
+    for i in range(200):
+        event_loop.run_until_complete(db.insert_task(1, f"task {i}", "details"))
+    return db_file
+
+
+def rows(db_file):
+    connection = sqlite3.connect(db_file)
+    try:
+        return connection.execute("SELECT * FROM tasks ORDER BY id").fetchall()
+    finally:
+        connection.close()
+
+
+def frames(path):
+    data = path.read_bytes()
+    offset, frames = len(MAGIC), []
+    while offset < len(data):
+        (length,) = FRAME_LENGTH.unpack_from(data, offset)
+        end = offset + FRAME_LENGTH.size + length
+        frames.append(data[offset:end])
+        offset = end
+    return frames
+
+
+async def test_backup_and_restore(database, tmp_path):
+    path, size, _seconds = await create_backup()
+    assert path.stat().st_size == size
+    assert len(frames(path)) > 2
+
+    await db.insert_task(1, "after the backup", None)
+    restore_backup(path, database)
+    assert len(rows(database)) == 200
+
+    copy = tmp_path / "copy.db"
+    restore_backup(path, copy)
+    assert rows(copy) == rows(database)
+
+
+async def test_truncated_backup_is_refused(database, tmp_path):
+    path, size, _seconds = await create_backup()
+    target = tmp_path / "restored.db"
+    for cut in (len(MAGIC) + 2, size // 2, size - 1):
+        damaged = tmp_path / "damaged.backup"
+        damaged.write_bytes(path.read_bytes()[:cut])
+        with pytest.raises(BackupError):
+            restore_backup(damaged, target)
+    # a whole missing frame, including the closing one
+    damaged.write_bytes(MAGIC + b"".join(frames(path)[:-1]))
+    with pytest.raises(BackupError):
+        restore_backup(damaged, target)
+
+
+async def test_reordered_backup_is_refused(database, tmp_path):
+    path, _size, _seconds = await create_backup()
+    first, second, *rest = frames(path)
+    damaged = tmp_path / "damaged.backup"
+    damaged.write_bytes(MAGIC + second + first + b"".join(rest))
+    with pytest.raises(BackupError):
+        restore_backup(damaged, tmp_path / "restored.db")
+
+
+async def test_foreign_file_is_refused(database, tmp_path):
+    with pytest.raises(BackupError):
+        restore_backup(database, tmp_path / "restored.db")
+
+
+async def test_rotation_keeps_backup_keep(database, tmp_path):
+    backup_dir = tmp_path / "backups"
+    backup_dir.mkdir()
+    other = backup_dir / "bot-staging-20260101-120000-000000.backup"
+    other.touch()
+
+    created = [(await create_backup())[0] for _ in range(4)]
+    assert list_backups(backup_dir, database) == created[-2:]
+    assert other.exists()
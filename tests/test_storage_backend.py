@@ -0,0 +1,436 @@
+"""Conformance suite run against every StorageBackend implementation.
+
+The SQLite leg uses a temporary file. The Postgres leg uses
+TEST_DATABASE_URL and empties its tables first; without it, it starts a
+throwaway local server if ``pgserver`` is installed, and is skipped
+otherwise.
+"""
+
+import asyncio
+import tempfile
+
+import pytest
+from conftest import POSTGRES_URL
+
+from utils.db.backend import SQLiteBackend
+from utils.db.db import PRIORITY_HIGH, PRIORITY_LOW, QuotaExceeded
+
+TABLES = (
+    "tasks, task_tokens, user_settings, notifications, outbox, scheduler_checkpoints"
+)
+
+
+@pytest.fixture(scope="session")
+def postgres_url():
+    if POSTGRES_URL:
+        yield POSTGRES_URL
+        return
+    pgserver = pytest.importorskip(
+        "pgserver", reason="set TEST_DATABASE_URL to run the Postgres leg"
+    )
+    with tempfile.TemporaryDirectory() as data_dir:
+        server = pgserver.get_server(data_dir, cleanup_mode="stop")
+        yield server.get_uri()
+        server.cleanup()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def backend(request, tmp_path, configure, event_loop):
+    if request.param == "sqlite":
+        configure(DB_BACKEND="sqlite", DB_FILENAME=tmp_path / "bot.db")
+        backend = SQLiteBackend()
+        event_loop.run_until_complete(backend.init())
+    else:
+        pytest.importorskip("asyncpg")
+        url = request.getfixturevalue("postgres_url")
+        configure(DB_BACKEND="postgres", DATABASE_URL=url)
+        from utils.db.postgres import PostgresBackend
+
+        backend = PostgresBackend(url)
+        event_loop.run_until_complete(backend.init())
+        event_loop.run_until_complete(
+            backend.pool.execute(f"TRUNCATE {TABLES} RESTART IDENTITY CASCADE")
+        )
+    yield backend
+    event_loop.run_until_complete(backend.close())
+
+
+async def task_ids(backend, user_id):
+    return {task[1]: task[0] async for task in backend.iter_tasks(user_id)}
+
+
+def names(tasks):
+    return [task[1] for task in tasks]
+
+
+# lifecycle
+async def test_init_is_idempotent(backend):
+    await backend.init()
+    await backend.insert_task(1, "kept", None)
+    await backend.init()
+    assert list(await task_ids(backend, 1)) == ["kept"]
+
+
+async def test_migrate_reports_a_dict(backend):
+    assert isinstance(await backend.migrate(), dict)
+
+
+async def test_migrate_has_nothing_left_to_do(backend):
+    # words too short to index leave a task without search tokens
+    await backend.insert_task(1, "🎉 a", None)
+    await backend.insert_task(1, "indexed", "x")
+    await backend.migrate()
+    result = await backend.migrate()
+    assert not result.get("indexed")
+    assert not result.get("compacted")
+
+
+async def test_checkpoints_upsert(backend):
+    assert await backend.get_checkpoints() == {}
+    await backend.save_checkpoints({"reminders": 60.0, "notifications": 120.0})
+    await backend.save_checkpoints({"reminders": 180.0})
+    assert await backend.get_checkpoints() == {
+        "reminders": 180.0,
+        "notifications": 120.0,
+    }
+
+
+# settings
+async def test_user_settings_default_row(backend):
+    default = {
+        "description_optional": 0,
+        "reminder_optional": 0,
+        "reminder_time": None,
+    }
+    assert await backend.get_user_settings(1) == default
+    assert await backend.get_user_settings(1) == default
+
+
+async def test_toggles_flip_atomically(backend):
+    assert await backend.toggle_description_optional(1) == 1
+    assert await backend.toggle_description_optional(1) == 0
+    # an odd number of concurrent flips always ends switched on
+    await asyncio.gather(*(backend.toggle_reminder_optional(2) for _ in range(5)))
+    settings = await backend.get_user_settings(2)
+    assert settings["reminder_optional"] == 1
+    assert settings["description_optional"] == 0
+
+
+async def test_reminder_times(backend):
+    await backend.get_user_settings(1)
+    await backend.update_reminder_time(1, "08:30")
+    assert (await backend.get_user_settings(1))["reminder_time"] == "08:30"
+
+    await backend.toggle_reminder_optional(1)
+    await backend.save_reminder_times([(1, "09:00"), (2, "10:00")])
+    assert await backend.get_user_settings(1) == {
+        "description_optional": 0,
+        "reminder_optional": 1,
+        "reminder_time": "09:00",
+    }
+    assert (await backend.get_user_settings(2))["reminder_time"] == "10:00"
+
+
+async def test_user_language(backend):
+    assert await backend.get_user_language(1) is None
+    await backend.set_user_language(1, "ru")
+    await backend.set_user_language(1, "en")
+    assert await backend.get_user_language(1) == "en"
+    # the language row and the settings row are the same
+    await backend.toggle_description_optional(1)
+    assert await backend.get_user_language(1) == "en"
+
+
+# tasks
+async def test_insert_and_get_single_task(backend):
+    await backend.insert_task(1, "buy milk", "two bottles " * 40)
+    await backend.insert_task(1, "no description", None)
+    ids = await task_ids(backend, 1)
+
+    assert await backend.get_single_task(ids["buy milk"]) == (
+        "buy milk",
+        "two bottles " * 40,
+        0,
+        1,
+        None,
+    )
+    # ids arrive from callback data as strings
+    assert await backend.get_single_task(str(ids["no description"])) == (
+        "no description",
+        "",
+        0,
+        1,
+        None,
+    )
+    assert await backend.get_single_task(10**9) is None
+
+
+async def test_iter_tasks_order_across_chunks(backend):
+    for name in ("low", "dated late", "plain 1", "dated soon", "high", "plain 2"):
+        await backend.insert_task(1, name, None)
+    await backend.insert_task(2, "other user", None)
+    ids = await task_ids(backend, 1)
+    await backend.set_task_priority(1, ids["high"], PRIORITY_HIGH)
+    await backend.set_task_priority(1, ids["low"], PRIORITY_LOW)
+    await backend.set_task_due_date(1, ids["dated late"], "2026-05-01")
+    await backend.set_task_due_date(1, ids["dated soon"], "2026-01-01")
+    await backend.insert_task(1, "done", None)
+    await backend.toggle_task_status(1, (await task_ids(backend, 1))["done"])
+
+    expected = ["high", "dated soon", "dated late", "plain 1", "plain 2", "low"]
+    for chunk_size in (1, 2, 100):
+        tasks = [task async for task in backend.iter_tasks(1, chunk_size)]
+        assert names(tasks) == expected
+    task = [task async for task in backend.iter_tasks(1)][1]
+    assert task == (ids["dated soon"], "dated soon", "", 0, 1, "2026-01-01")
+
+
+async def test_get_due_tasks(backend):
+    for name in ("undated", "overdue", "today", "future", "done"):
+        await backend.insert_task(1, name, None)
+    ids = await task_ids(backend, 1)
+    await backend.set_task_due_date(1, ids["overdue"], "2026-01-01")
+    await backend.set_task_due_date(1, ids["today"], "2026-06-01")
+    await backend.set_task_due_date(1, ids["future"], "2026-12-01")
+    await backend.set_task_due_date(1, ids["done"], "2026-01-01")
+    await backend.toggle_task_status(1, ids["done"])
+    await backend.set_task_priority(1, ids["undated"], PRIORITY_HIGH)
+
+    due = await backend.get_due_tasks(1, "2026-06-01", 20)
+    assert names(due) == ["undated", "overdue", "today"]
+    assert names(await backend.get_due_tasks(1, "2026-06-01", 2)) == [
+        "undated",
+        "overdue",
+    ]
+    assert await backend.get_due_tasks(2, "2026-06-01", 20) == []
+
+
+async def test_set_task_name_reindexes(backend):
+    await backend.insert_task(1, "old name", "details")
+    task_id = (await task_ids(backend, 1))["old name"]
+    await backend.set_task_name(str(task_id), "new name")
+
+    assert (await backend.get_single_task(task_id))[:2] == ("new name", "details")
+    assert await backend.search_tasks(1, "old") == []
+    assert names(await backend.search_tasks(1, "new details")) == ["new name"]
+
+
+async def test_set_task_status_compare_and_set(backend):
+    await backend.insert_task(1, "task", None)
+    task_id = (await task_ids(backend, 1))["task"]
+
+    # another user's task is reported as missing, not as already changed
+    assert await backend.set_task_status(2, task_id, 0, 1) is None
+    assert await backend.set_task_status(1, task_id, 0, 1) == ("task", 1)
+    assert await backend.set_task_status(1, str(task_id), 0, 1) == (None, 1)
+    assert await backend.set_task_status(1, 10**9, 0, 1) is None
+    assert (await backend.get_single_task(task_id))[2] == 1
+
+
+async def test_toggle_task_status(backend):
+    await backend.insert_task(1, "task", None)
+    task_id = (await task_ids(backend, 1))["task"]
+
+    assert await backend.toggle_task_status(1, task_id) == ("task", 1)
+    assert await backend.toggle_task_status(1, str(task_id)) == ("task", 0)
+    assert await backend.toggle_task_status(2, task_id) is None
+
+
+async def test_priority_and_due_date_setters(backend):
+    await backend.insert_task(1, "task", None)
+    task_id = (await task_ids(backend, 1))["task"]
+
+    assert await backend.set_task_priority(1, task_id, PRIORITY_LOW) == "task"
+    assert await backend.set_task_due_date(1, task_id, "2026-03-01") == "task"
+    assert (await backend.get_single_task(task_id))[3:] == (PRIORITY_LOW, "2026-03-01")
+    assert await backend.set_task_due_date(1, task_id, None) == "task"
+    assert (await backend.get_single_task(task_id))[4] is None
+    # another user's task is left alone
+    assert await backend.set_task_priority(2, task_id, PRIORITY_HIGH) is None
+    assert await backend.set_task_due_date(2, task_id, "2026-03-01") is None
+
+
+async def test_search_tasks(backend):
+    await backend.insert_task(1, "Buy milk", "from the shop")
+    await backend.insert_task(1, "milk the cow", None)
+    await backend.insert_task(1, "Молоко купить", None)
+    await backend.insert_task(2, "buy milk", None)
+    ids = await task_ids(backend, 1)
+    await backend.set_task_priority(1, ids["milk the cow"], PRIORITY_HIGH)
+    await backend.toggle_task_status(1, ids["Buy milk"])
+
+    # open tasks first, every word must match, case-insensitive
+    assert names(await backend.search_tasks(1, "MILK")) == [
+        "milk the cow",
+        "Buy milk",
+    ]
+    assert names(await backend.search_tasks(1, "milk shop")) == ["Buy milk"]
+    assert names(await backend.search_tasks(1, "молоко")) == ["Молоко купить"]
+    assert names(await backend.search_tasks(1, "milk", limit=1)) == ["milk the cow"]
+    assert await backend.search_tasks(1, "bread") == []
+    assert await backend.search_tasks(1, "") == []
+    assert names(await backend.search_tasks(2, "milk")) == ["buy milk"]
+
+
+async def test_clear_tasks_removes_done(backend):
+    await backend.insert_task(1, "done task", None)
+    await backend.insert_task(1, "open task", None)
+    ids = await task_ids(backend, 1)
+    await backend.toggle_task_status(1, ids["done task"])
+
+    await backend.clear_tasks()
+    assert await backend.get_single_task(ids["done task"]) is None
+    assert await backend.search_tasks(1, "task") == [
+        (ids["open task"], "open task", "", 0, 1, None)
+    ]
+
+
+async def test_task_quota_holds_under_concurrency(backend, configure):
+    configure(QUOTA_MAX_ROWS=3)
+    results = await asyncio.gather(
+        *(backend.insert_task(1, f"task {i}", None) for i in range(8)),
+        return_exceptions=True,
+    )
+    assert sum(isinstance(result, QuotaExceeded) for result in results) == 5
+    assert len(await task_ids(backend, 1)) == 3
+    # the quota is per user
+    await backend.insert_task(2, "task", None)
+
+
+async def test_byte_quota(backend, configure):
+    configure(QUOTA_MAX_BYTES=600)
+    await backend.insert_task(1, "short", None)
+    with pytest.raises(QuotaExceeded):
+        await backend.insert_task(1, "long", "x" * 1000 + str(list(range(200))))
+    with pytest.raises(QuotaExceeded):
+        await backend.insert_notification(1, "n" * 1000, "01.01.2026", "10:00")
+
+
+# notifications
+async def test_notifications(backend):
+    await backend.insert_notification(1, "call mom", "01.01.2026", "10:00")
+    await backend.insert_notification(1, "pay rent", "02.01.2026", "11:00")
+    await backend.insert_notification(2, "other", "01.01.2026", "10:00")
+
+    notifications = await backend.get_notifications(1)
+    assert [n[1:] for n in notifications] == [
+        ("call mom", "01.01.2026", "10:00"),
+        ("pay rent", "02.01.2026", "11:00"),
+    ]
+    call_id, rent_id = (n[0] for n in notifications)
+
+    await backend.update_notification(str(call_id), "03.01.2026", "12:00")
+    assert await backend.get_single_notification(call_id) == (
+        "call mom",
+        "03.01.2026",
+        "12:00",
+    )
+    assert await backend.get_single_notification(10**9) is None
+
+    await backend.disable_notification(rent_id)
+    assert [n[0] for n in await backend.get_notifications(1)] == [call_id]
+    assert await backend.get_single_notification(rent_id) is not None
+    await backend.clear_notifications()
+    assert await backend.get_single_notification(rent_id) is None
+    assert await backend.get_single_notification(call_id) is not None
+
+
+async def test_notification_quota(backend, configure):
+    configure(QUOTA_MAX_ROWS=2)
+    await backend.insert_notification(1, "a", "01.01.2026", "10:00")
+    await backend.insert_notification(1, "b", "01.01.2026", "10:00")
+    with pytest.raises(QuotaExceeded):
+        await backend.insert_notification(1, "c", "01.01.2026", "10:00")
+
+
+# outbox
+async def test_enqueue_due_notifications_once(backend):
+    await backend.insert_notification(1, "call mom", "01.01.2026", "10:00")
+    await backend.insert_notification(2, "later", "01.01.2026", "10:01")
+    notification_id = (await backend.get_notifications(1))[0][0]
+
+    assert await backend.enqueue_due_notifications("01.01.2026", "10:00") == 1
+    assert await backend.enqueue_due_notifications("01.01.2026", "10:00") == 0
+    assert await backend.get_notifications(1) == []
+    assert len(await backend.get_notifications(2)) == 1
+
+    entries = await backend.claim_outbox(1000.0, 60, 10)
+    assert entries == [
+        (entries[0][0], "notification", 1, str(notification_id), "call mom", 1)
+    ]
+
+
+async def test_enqueue_reminders_once_per_day(backend):
+    for user_id, reminder_time in ((1, "10:00"), (2, "10:00"), (3, "11:00")):
+        await backend.get_user_settings(user_id)
+        await backend.toggle_reminder_optional(user_id)
+        await backend.update_reminder_time(user_id, reminder_time)
+    await backend.save_reminder_times([(4, "10:00")])  # reminders switched off
+
+    assert await backend.enqueue_reminders("10:00", "01.01.2026") == 2
+    assert await backend.enqueue_reminders("10:00", "01.01.2026") == 0
+    assert await backend.enqueue_reminders("10:00", "02.01.2026") == 2
+
+    entries = await backend.claim_outbox(1000.0, 60, 10)
+    assert sorted(entry[2:5] for entry in entries) == [
+        (1, "01.01.2026", None),
+        (1, "02.01.2026", None),
+        (2, "01.01.2026", None),
+        (2, "02.01.2026", None),
+    ]
+    assert {entry[1] for entry in entries} == {"reminder"}
+
+
+async def fill_outbox(backend, count):
+    for user_id in range(1, count + 1):
+        await backend.insert_notification(user_id, f"n{user_id}", "01.01.2026", "10:00")
+    await backend.enqueue_due_notifications("01.01.2026", "10:00")
+
+
+async def test_claim_outbox_leases(backend):
+    await fill_outbox(backend, 5)
+
+    first = await backend.claim_outbox(1000.0, 60, 3)
+    assert [entry[2] for entry in first] == [1, 2, 3]
+    # leased entries are not handed out again until the lease runs out
+    second = await backend.claim_outbox(1000.0, 60, 10)
+    assert [entry[2] for entry in second] == [4, 5]
+    assert await backend.claim_outbox(1059.0, 60, 10) == []
+    again = await backend.claim_outbox(1060.0, 60, 10)
+    assert [(entry[2], entry[5]) for entry in again] == [
+        (user_id, 2) for user_id in range(1, 6)
+    ]
+
+
+async def test_concurrent_claims_are_disjoint(backend):
+    await fill_outbox(backend, 20)
+    batches = await asyncio.gather(
+        *(backend.claim_outbox(1000.0, 60, 4) for _ in range(6))
+    )
+    claimed = [entry[0] for batch in batches for entry in batch]
+    assert len(claimed) == len(set(claimed)) == 20
+
+
+async def test_complete_outbox(backend):
+    await fill_outbox(backend, 4)
+    entries = await backend.claim_outbox(1000.0, 60, 10)
+    delivered, retried, released, untouched = (entry[0] for entry in entries)
+
+    await backend.complete_outbox(
+        [delivered], [(retried, 1100.0)], [(released, 1050.0)]
+    )
+    assert await backend.claim_outbox(1049.0, 60, 10) == []
+    # a released entry was never tried, so its claim is not counted
+    assert [(e[0], e[5]) for e in await backend.claim_outbox(1050.0, 60, 10)] == [
+        (released, 1)
+    ]
+    # the untouched entry comes back once its lease has run out
+    assert [(e[0], e[5]) for e in await backend.claim_outbox(1060.0, 60, 10)] == [
+        (untouched, 2)
+    ]
+    assert [(e[0], e[5]) for e in await backend.claim_outbox(1100.0, 60, 10)] == [
+        (retried, 2)
+    ]
+    await backend.complete_outbox([released, untouched, retried], [], [])
+    assert await backend.claim_outbox(2000.0, 60, 10) == []
+    await backend.complete_outbox([], [], [])
@@ -0,0 +1,196 @@
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from config import get_config
+from utils.db import db
+
+
+class StorageBackend(ABC):
+    """Persistence used by handlers and schedulers.
+
+    Tasks and notification names are passed in and returned as plaintext;
+    encryption, the search index and quotas are the backend's job. Methods
+    that enqueue or claim rows mark them in the same transaction that reads
+    them, so several bot instances can share one database."""
+
+    async def init(self):
+        pass
+
+    async def migrate(self):
+        """Run online data migrations; returns a dict of what was done."""
+        return {}
+
+    async def close(self):
+        pass
+
+    # settings
+    @abstractmethod
+    async def get_user_settings(self, user_id): ...
+
+    @abstractmethod
+    async def toggle_description_optional(self, user_id): ...
+
+    @abstractmethod
+    async def toggle_reminder_optional(self, user_id): ...
+
+    @abstractmethod
+    async def update_reminder_time(self, user_id, reminder_time): ...
+
+    @abstractmethod
+    async def save_reminder_times(self, rows): ...
+
+    @abstractmethod
+    async def get_user_language(self, user_id): ...
+
+    @abstractmethod
+    async def set_user_language(self, user_id, language): ...
+
+    # tasks
+    @abstractmethod
+    def iter_tasks(self, user_id, chunk_size=db.TASKS_CHUNK_SIZE): ...
+
+    @abstractmethod
+    async def get_due_tasks(self, user_id, due_by, limit): ...
+
+    @abstractmethod
+    async def get_single_task(self, task_id): ...
+
+    @abstractmethod
+    async def insert_task(self, user_id, task, description): ...
+
+    @abstractmethod
+    async def set_task_name(self, task_id, task_name): ...
+
+    @abstractmethod
+    async def set_task_status(self, user_id, task_id, expected_status, new_status):
+        ...
+
+    @abstractmethod
+    async def toggle_task_status(self, user_id, task_id): ...
+
+    @abstractmethod
+    async def set_task_priority(self, user_id, task_id, priority): ...
+
+    @abstractmethod
+    async def set_task_due_date(self, user_id, task_id, due_at): ...
+
+    @abstractmethod
+    async def search_tasks(self, user_id, query, limit=db.TASKS_CHUNK_SIZE): ...
+
+    @abstractmethod
+    async def clear_tasks(self): ...
+
+    # notifications
+    @abstractmethod
+    async def get_notifications(self, user_id): ...
+
+    @abstractmethod
+    async def get_single_notification(self, notification_id): ...
+
+    @abstractmethod
+    async def insert_notification(
+        self, user_id, notification_name, notification_date, notification_time
+    ): ...
+
+    @abstractmethod
+    async def update_notification(
+        self, notification_id, notification_date, notification_time
+    ): ...
+
+    @abstractmethod
+    async def disable_notification(self, notification_id): ...
+
+    @abstractmethod
+    async def clear_notifications(self): ...
+
+    # outbox
+    @abstractmethod
+    async def enqueue_reminders(self, reminder_time, reminder_date): ...
+
+    @abstractmethod
+    async def enqueue_due_notifications(self, notification_date, notification_time):
+        ...
+
+    @abstractmethod
+    async def claim_outbox(self, now, lease, limit): ...
+
+    @abstractmethod
+    async def complete_outbox(self, delivered, retries, released=()): ...
+
+    # lifecycle
+    @abstractmethod
+    async def get_checkpoints(self): ...
+
+    @abstractmethod
+    async def save_checkpoints(self, checkpoints): ...
+
+
+class SQLiteBackend(StorageBackend):
+    """The aiosqlite implementation in utils/db/db.py."""
+
+    init = staticmethod(db.db_init)
+    close = staticmethod(db.db_close)
+
+    get_user_settings = staticmethod(db.get_user_settings)
+    toggle_description_optional = staticmethod(db.toggle_description_optional)
+    toggle_reminder_optional = staticmethod(db.toggle_reminder_optional)
+    update_reminder_time = staticmethod(db.update_reminder_time)
+    save_reminder_times = staticmethod(db.save_reminder_times)
+    get_user_language = staticmethod(db.get_user_language)
+    set_user_language = staticmethod(db.set_user_language)
+
+    iter_tasks = staticmethod(db.iter_tasks)
+    get_due_tasks = staticmethod(db.get_due_tasks)
+    get_single_task = staticmethod(db.get_single_task)
+    insert_task = staticmethod(db.insert_task)
+    set_task_name = staticmethod(db.set_task_name)
+    set_task_status = staticmethod(db.set_task_status)
+    toggle_task_status = staticmethod(db.toggle_task_status)
+    set_task_priority = staticmethod(db.set_task_priority)
+    set_task_due_date = staticmethod(db.set_task_due_date)
+    search_tasks = staticmethod(db.search_tasks)
+    clear_tasks = staticmethod(db.clear_tasks)
+
+    get_notifications = staticmethod(db.get_notifications)
+    get_single_notification = staticmethod(db.get_single_notification)
+    insert_notification = staticmethod(db.insert_notification)
+    update_notification = staticmethod(db.update_notification)
+    disable_notification = staticmethod(db.disable_notification)
+    clear_notifications = staticmethod(db.clear_notifications)
+
+    enqueue_reminders = staticmethod(db.enqueue_reminders)
+    enqueue_due_notifications = staticmethod(db.enqueue_due_notifications)
+    claim_outbox = staticmethod(db.claim_outbox)
+    complete_outbox = staticmethod(db.complete_outbox)
+
+    get_checkpoints = staticmethod(db.get_checkpoints)
+    save_checkpoints = staticmethod(db.save_checkpoints)
+
+    async def migrate(self):
+        result = {"indexed": await db.backfill_task_tokens()}
+        if get_config().storage_encoding == "compact":
+            converted, size_before, size_after = await db.compact_storage()
+            result.update(
+                compacted=converted, bytes_before=size_before, bytes_after=size_after
+            )
+        return result
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    backend = get_config().db_backend
+    if backend == "postgres":
+        # asyncpg is only needed for this backend
+        from utils.db.postgres import PostgresBackend
+
+        return PostgresBackend(get_config().database_url)
+    return SQLiteBackend()
+
+
+class _BackendProxy:
+    def __getattr__(self, name):
+        return getattr(get_backend(), name)
+
+
+# resolves the configured backend on first use, so importing is free
+storage = _BackendProxy()
@@ -0,0 +1,254 @@
+"""Online, encrypted backups of the SQLite database.
+
+A backup is taken with SQLite's online backup API while the bot keeps
+running, compressed, and sealed with the storage Fernet key, so it can only
+be restored with the same FERNET_KEY.
+
+Usage, from the repository root:
+    python -m utils.db.backup create
+    python -m utils.db.backup restore BACKUP_FILE [--to DB_FILE]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from cryptography.fernet import InvalidToken
+
+from config import get_config
+from utils.db.crypto import seal, unseal
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TODOBAK1"
+SUFFIX = ".backup"
+# pages copied per backup step (4 MiB at the default page size) and the
+# pause between steps, which leaves the disk to the handlers
+STEP_PAGES = 1024
+STEP_PAUSE = 0.005
+# compressed bytes per encrypted frame; kept small because sealing a frame
+# holds the GIL, and so the event loop, for its whole length
+CHUNK_SIZE = 256 * 1024
+
+# a frame is a length-prefixed Fernet token over: last flag, frame index,
+# data; the index and the empty last frame catch reordering and truncation
+FRAME_LENGTH = struct.Struct(">I")
+FRAME_HEADER = struct.Struct(">?Q")
+
+
+class BackupError(Exception):
+    pass
+
+
+def _snapshot(db_file, target_file, cancelled):
+    source = sqlite3.connect(db_file)
+    target = sqlite3.connect(target_file)
+
+    def step(status, remaining, total):
+        if cancelled.is_set():
+            raise BackupError("backup cancelled")
+        time.sleep(STEP_PAUSE)
+
+    try:
+        # an open read transaction pins one WAL snapshot for the whole copy:
+        # commits made meanwhile neither block on it nor restart the backup
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        source.backup(target, pages=STEP_PAGES, progress=step)
+    finally:
+        target.close()
+        source.close()
+
+
+def _compressed_chunks(file):
+    # stored payloads are encrypted already; higher levels gain next to
+    # nothing on them and only cost time
+    compressor = zlib.compressobj(1)
+    buffer = b""
+    while block := file.read(CHUNK_SIZE):
+        buffer += compressor.compress(block)
+        if len(buffer) >= CHUNK_SIZE:
+            yield buffer
+            buffer = b""
+    yield buffer + compressor.flush()
+
+
+def _write_frame(file, index, data, last=False):
+    token = seal(FRAME_HEADER.pack(last, index) + data)
+    file.write(FRAME_LENGTH.pack(len(token)) + token)
+
+
+def _seal_file(source_file, target_file, cancelled):
+    with open(source_file, "rb") as source, open(target_file, "wb") as target:
+        target.write(MAGIC)
+        index = -1
+        for index, chunk in enumerate(_compressed_chunks(source)):
+            if cancelled.is_set():
+                raise BackupError("backup cancelled")
+            _write_frame(target, index, chunk)
+            time.sleep(0)
+        _write_frame(target, index + 1, b"", last=True)
+
+
+def _read_frames(file):
+    if file.read(len(MAGIC)) != MAGIC:
+        raise BackupError("not a backup file")
+    expected = 0
+    while True:
+        prefix = file.read(FRAME_LENGTH.size)
+        if len(prefix) < FRAME_LENGTH.size:
+            raise BackupError("backup is truncated")
+        try:
+            frame = unseal(file.read(FRAME_LENGTH.unpack(prefix)[0]))
+        except InvalidToken:
+            raise BackupError("backup is damaged or FERNET_KEY differs") from None
+        last, index = FRAME_HEADER.unpack_from(frame)
+        if index != expected:
+            raise BackupError(f"frame {index} found where {expected} was expected")
+        if last:
+            return
+        yield frame[FRAME_HEADER.size :]
+        expected += 1
+
+
+def _unseal_file(source_file, target_file):
+    decompressor = zlib.decompressobj()
+    with open(source_file, "rb") as source, open(target_file, "wb") as target:
+        for data in _read_frames(source):
+            # bounded output: free pages compress a thousandfold
+            while data:
+                target.write(decompressor.decompress(data, CHUNK_SIZE))
+                data = decompressor.unconsumed_tail
+        target.write(decompressor.flush())
+        if not decompressor.eof:
+            raise BackupError("backup is truncated")
+
+
+def backup_name(db_file, now=None):
+    # microseconds, so two backups in the same second do not replace each other
+    now = now or datetime.now(timezone.utc)
+    return f"{Path(db_file).stem}-{now:%Y%m%d-%H%M%S-%f}{SUFFIX}"
+
+
+def list_backups(backup_dir, db_file):
+    """Backups of ``db_file``, oldest first.
+
+    Only exact ``<stem>-<timestamp>`` names count, so the backups of
+    ``bot-staging.db`` in the same directory are not taken for ``bot.db``'s.
+    Names without microseconds come from older versions."""
+    pattern = re.compile(
+        re.escape(Path(db_file).stem)
+        + r"-(\d{8}-\d{6})(?:-(\d{6}))?"
+        + re.escape(SUFFIX)
+    )
+    backups = []
+    if not Path(backup_dir).is_dir():
+        return backups
+    for path in Path(backup_dir).iterdir():
+        if match := pattern.fullmatch(path.name):
+            backups.append((match.group(1), match.group(2) or "", path))
+    return [path for _second, _micro, path in sorted(backups)]
+
+
+def rotate(backup_dir, db_file, keep):
+    old = list_backups(backup_dir, db_file)[:-keep]
+    for path in old:
+        path.unlink()
+    return old
+
+
+def _create_backup(db_file, backup_dir, cancelled):
+    backup_dir = Path(backup_dir)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    target = backup_dir / backup_name(db_file)
+    # the plain snapshot lives only until it is sealed; the backup appears
+    # under its final name complete or not at all
+    with tempfile.TemporaryDirectory(dir=backup_dir, prefix=".partial-") as tmp:
+        snapshot = Path(tmp) / "snapshot.db"
+        _snapshot(db_file, snapshot, cancelled)
+        sealed = Path(tmp) / target.name
+        _seal_file(snapshot, sealed, cancelled)
+        os.replace(sealed, target)
+    return target
+
+
+async def create_backup(db_file=None, backup_dir=None, keep=None):
+    """Back the database up in a worker thread and rotate old backups.
+
+    Returns the path and size of the new backup and the seconds it took."""
+    config = get_config()
+    db_file = db_file or config.db_file
+    backup_dir = backup_dir or config.backup_dir
+    keep = keep or config.backup_keep
+
+    started = time.monotonic()
+    cancelled = threading.Event()
+    try:
+        path = await asyncio.to_thread(_create_backup, db_file, backup_dir, cancelled)
+    except asyncio.CancelledError:
+        # the thread stops at its next step instead of running on unowned
+        cancelled.set()
+        raise
+    for old in rotate(backup_dir, db_file, keep):
+        logger.info("Removed old backup %s", old.name)
+    return path, path.stat().st_size, time.monotonic() - started
+
+
+def restore_backup(backup_file, db_file):
+    """Replace the contents of ``db_file`` with a backup.
+
+    Stop the bot first: open connections would keep writing to the old data.
+    """
+    db_dir = Path(db_file).resolve().parent
+    with tempfile.TemporaryDirectory(dir=db_dir, prefix=".restore-") as tmp:
+        restored = Path(tmp) / "restored.db"
+        _unseal_file(backup_file, restored)
+        source = sqlite3.connect(restored)
+        try:
+            (result,) = source.execute("PRAGMA integrity_check").fetchone()
+            if result != "ok":
+                raise BackupError(f"integrity check failed: {result}")
+            # through the backup API, so a WAL or journal of the old database
+            # cannot be replayed over the restored pages
+            target = sqlite3.connect(db_file)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m utils.db.backup",
+        description="Create or restore encrypted database backups.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="back up DB_FILENAME into BACKUP_DIR")
+    restore = commands.add_parser("restore", help="restore a backup; stop the bot")
+    restore.add_argument("backup_file")
+    restore.add_argument("--to", dest="db_file", help="default: DB_FILENAME")
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        path, size, seconds = asyncio.run(create_backup())
+        print(f"{path}: {size} bytes in {seconds:.1f} s")
+    else:
+        db_file = args.db_file or get_config().db_file
+        restore_backup(args.backup_file, db_file)
+        print(f"Restored {args.backup_file} into {db_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import base64
+import zlib
+from functools import lru_cache
+
+from cryptography.fernet import Fernet
+
+from config import get_config
+
+# Compact encoding stores the raw Fernet token as a BLOB instead of its
+# base64 text, and prefixes the plaintext with a flag byte so long values can
+# be compressed before encryption. Legacy TEXT tokens are still readable.
+FLAG_PLAIN = b"\x00"
+FLAG_ZLIB = b"\x01"
+
+
+@lru_cache(maxsize=None)
+def get_encryption_key():
+    key = get_config().fernet_key
+    if not key:
+        key = Fernet.generate_key().decode()
+        print(f"Generated encryption key: {key}")
+    return key.encode()
+
+
+@lru_cache(maxsize=None)
+def get_fernet():
+    return Fernet(get_encryption_key())
+
+
+def seal(data):
+    """Encrypt bytes into a raw (not base64) Fernet token."""
+    return base64.urlsafe_b64decode(get_fernet().encrypt(data))
+
+
+def unseal(blob):
+    return get_fernet().decrypt(base64.urlsafe_b64encode(blob))
+
+
+def encode_compact(text, compress=False):
+    data = text.encode()
+    payload = FLAG_PLAIN + data
+    if compress and len(data) >= get_config().compress_min_length:
+        compressed = FLAG_ZLIB + zlib.compress(data, 9)
+        if len(compressed) < len(payload):
+            payload = compressed
+    return seal(payload)
+
+
+def decode_compact(blob):
+    payload = unseal(blob)
+    flag, data = payload[:1], payload[1:]
+    if flag == FLAG_ZLIB:
+        data = zlib.decompress(data)
+    return data.decode()
+
+
+def encrypt_text(text, compress=False):
+    if get_config().storage_encoding == "compact":
+        return encode_compact(text, compress)
+    return get_fernet().encrypt(text.encode()).decode()
+
+
+def decrypt_text(encrypted_text):
+    if isinstance(encrypted_text, bytes):
+        return decode_compact(encrypted_text)
+    return get_fernet().decrypt(encrypted_text.encode()).decode()
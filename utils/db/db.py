@@ -1,32 +1,41 @@
 import asyncio
-import os
-from datetime import datetime
 
 import aiosqlite
-import pytz
-from cryptography.fernet import Fernet
-from dotenv import load_dotenv
 
-load_dotenv()
+from config import get_config
+from utils.db.crypto import decrypt_text, encrypt_text
+from utils.db.search import token_hashes
 
-DB_FILE = os.getenv("DB_FILENAME")
 time_format = "%H:%M"
-db_clear_period = int(os.getenv("DB_CLEAR_PERIOD"))
+TASKS_CHUNK_SIZE = 100
 
+PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW = 0, 1, 2
+# ISO date that sorts after every real due date, so the ordering index
+# needs no NULL handling
+NO_DUE_DATE = "9999-12-31"
+# task_tokens hash of a task that has no indexable words
+NO_TOKENS = b""
+TASK_COLUMNS = "id, task, description, status, priority, due_at"
 
-def get_encryption_key():
-    key = os.getenv("FERNET_KEY")
-    if not key:
-        key = Fernet.generate_key()
-        print(f"Generated encryption key: {key.decode()}")
-    return Fernet(key)
+# encrypted bytes a user holds across tasks and notifications
+USAGE_SQL = """(SELECT IFNULL(SUM(LENGTH(task) + IFNULL(LENGTH(description), 0)), 0)
+    FROM tasks WHERE user_id = :user_id)
+    + (SELECT IFNULL(SUM(LENGTH(notification_name)), 0)
+    FROM notifications WHERE user_id = :user_id)"""
 
 
-fernet = get_encryption_key()
+class QuotaExceeded(Exception):
+    pass
+
+
+def connect():
+    return aiosqlite.connect(get_config().db_file)
 
 
 async def db_init():
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
+        # readers (handlers, backups) work on snapshots and never block writers
+        await db.execute("PRAGMA journal_mode=WAL")
         await db.execute(
             """CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY,
             user_id INTEGER, task TEXT, description TEXT,
@@ -49,20 +58,71 @@ async def db_init():
             notification_time TEXT,
             is_active INTEGER DEFAULT 1)"""
         )
+        await db.execute(
+            """CREATE INDEX IF NOT EXISTS notifications_user_id
+            ON notifications (user_id)"""
+        )
+        await db.execute(
+            """CREATE TABLE IF NOT EXISTS task_tokens (
+            user_id INTEGER,
+            token_hash BLOB,
+            task_id INTEGER,
+            PRIMARY KEY (user_id, token_hash, task_id)) WITHOUT ROWID"""
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS task_tokens_task_id ON task_tokens (task_id)"
+        )
+        await db.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            ref TEXT NOT NULL,
+            payload BLOB,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            UNIQUE (kind, user_id, ref))"""
+        )
+        await db.execute(
+            """CREATE INDEX IF NOT EXISTS outbox_next_attempt_at
+            ON outbox (next_attempt_at)"""
+        )
+        await db.execute(
+            """CREATE TABLE IF NOT EXISTS scheduler_checkpoints (
+            name TEXT PRIMARY KEY,
+            last_tick REAL)"""
+        )
+        await _add_columns(
+            db, "user_settings", {"language": "TEXT", "reminder_sent_on": "TEXT"}
+        )
+        await _add_columns(
+            db,
+            "tasks",
+            {
+                "priority": f"INTEGER NOT NULL DEFAULT {PRIORITY_NORMAL}",
+                "due_at": f"TEXT NOT NULL DEFAULT '{NO_DUE_DATE}'",
+            },
+        )
+        # listings walk this index in order; it also covers lookups by user
+        await db.execute(
+            """CREATE INDEX IF NOT EXISTS tasks_user_order
+            ON tasks (user_id, status, priority, due_at)"""
+        )
+        await db.execute("DROP INDEX IF EXISTS tasks_user_id")
         await db.commit()
 
 
-def encrypt_text(text):
-    return fernet.encrypt(text.encode()).decode()
-
-
-def decrypt_text(encrypted_text):
-    return fernet.decrypt(encrypted_text.encode()).decode()
+async def _add_columns(db, table, columns):
+    rows = await db.execute_fetchall(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in rows}
+    for column, definition in columns.items():
+        if column not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
 
 # Settings
 async def get_user_settings(user_id):
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
         cursor = await db.execute(
             """SELECT description_optional, reminder_optional,
             reminder_time FROM user_settings WHERE user_id = ?""",
@@ -74,7 +134,8 @@ async def get_user_settings(user_id):
             await db.execute(
                 """INSERT INTO user_settings (user_id,
                 description_optional,reminder_optional,
-                reminder_time) VALUES (?, 0, 0, NULL)""",
+                reminder_time) VALUES (?, 0, 0, NULL)
+                ON CONFLICT (user_id) DO NOTHING""",
                 (user_id,),
             )
             await db.commit()
@@ -86,37 +147,29 @@ async def get_user_settings(user_id):
         }
 
 
-async def toggle_description_optional(user_id):
-    async with aiosqlite.connect(DB_FILE) as db:
-        user_settings = await get_user_settings(user_id)
-        current_setting = user_settings["description_optional"]
-        new_setting = 1 if current_setting == 0 else 0
-        await db.execute(
-            """UPDATE user_settings SET
-            description_optional = ? WHERE user_id = ?""",
-            (new_setting, user_id),
+async def _toggle_setting(user_id, column):
+    async with connect() as db:
+        cursor = await db.execute(
+            f"""INSERT INTO user_settings (user_id, {column}) VALUES (?, 1)
+            ON CONFLICT (user_id) DO UPDATE SET {column} = 1 - {column}
+            RETURNING {column}""",
+            (user_id,),
         )
+        (new_setting,) = await cursor.fetchone()
         await db.commit()
         return new_setting
 
 
-async def toggle_reminder_optional(user_id):
-    async with aiosqlite.connect(DB_FILE) as db:
-        settings = await get_user_settings(user_id)
-        current_setting = settings["reminder_optional"]
+async def toggle_description_optional(user_id):
+    return await _toggle_setting(user_id, "description_optional")
 
-        new_setting = 1 if current_setting == 0 else 0
 
-        await db.execute(
-            "UPDATE user_settings SET reminder_optional = ? WHERE user_id = ?",
-            (new_setting, user_id),
-        )
-        await db.commit()
-        return new_setting
+async def toggle_reminder_optional(user_id):
+    return await _toggle_setting(user_id, "reminder_optional")
 
 
 async def update_reminder_time(user_id, reminder_time):
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE user_settings SET reminder_time = ? WHERE user_id = ?",
             (reminder_time, user_id),
@@ -124,87 +177,89 @@ async def update_reminder_time(user_id, reminder_time):
         await db.commit()
 
 
-async def reminder_scheduler(bot):
-    while True:
-        now = datetime.now(pytz.timezone("Europe/Moscow")).strftime("%H:%M")
+async def save_reminder_times(rows):
+    """Upsert ``(user_id, reminder_time)`` rows in one transaction."""
+    async with connect() as db:
+        await db.executemany(
+            """INSERT INTO user_settings (user_id, reminder_time) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+            reminder_time = excluded.reminder_time""",
+            rows,
+        )
+        await db.commit()
 
-        async with aiosqlite.connect(DB_FILE) as db:
-            cursor = await db.execute(
-                """SELECT user_id FROM user_settings WHERE
-                reminder_optional = 1 AND reminder_time = ?""",
-                (now,),
-            )
-            users = await cursor.fetchall()
 
-        if users:
-            for user in users:
-                user_id = user[0]
-                tasks = await get_tasks(user_id)
-                if tasks:
-                    await bot.send_message(user_id, "Your tasks for today:")
-                    for task in tasks:
-                        task_name = task[1]
-                        task_status = "✅" if task[3] == 1 else "❌"
-                        task_text = f"{task_name} {task_status}"
-                        await bot.send_message(user_id, task_text)
+async def get_user_language(user_id):
+    async with connect() as db:
+        cursor = await db.execute(
+            "SELECT language FROM user_settings WHERE user_id = ?", (user_id,)
+        )
+        row = await cursor.fetchone()
+    return row[0] if row else None
 
-        await asyncio.sleep(60)
 
+async def set_user_language(user_id, language):
+    async with connect() as db:
+        await db.execute(
+            """INSERT INTO user_settings (user_id, language) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET language = excluded.language""",
+            (user_id, language),
+        )
+        await db.commit()
 
-async def notification_scheduler(bot):
-    while True:
-        now = datetime.now(pytz.timezone("Europe/Moscow"))
 
-        async with aiosqlite.connect(DB_FILE) as db:
-            cursor = await db.execute(
-                """SELECT id, user_id, notification_name FROM notifications 
-                WHERE notification_date = ? AND
-                notification_time = ? AND is_active = 1""",
-                (now.strftime("%d.%m.%Y"), now.strftime("%H:%M")),
+def _task(row):
+    task_id, task, description, status, priority, due_at = row
+    return (
+        task_id,
+        decrypt_text(task),
+        decrypt_text(description) if description else "",
+        status,
+        priority,
+        None if due_at == NO_DUE_DATE else due_at,
+    )
+
+
+async def iter_tasks(user_id, chunk_size=TASKS_CHUNK_SIZE):
+    # keyset pagination along tasks_user_order: every chunk is a short, fully
+    # consumed query, so no read lock is held while the consumer is busy
+    # sending messages, and only the rows shown are decrypted
+    last = (PRIORITY_HIGH - 1, "", 0)
+    async with connect() as db:
+        while True:
+            tasks = await db.execute_fetchall(
+                f"""SELECT {TASK_COLUMNS} FROM tasks
+                WHERE user_id = ? AND status = 0
+                AND (priority, due_at, id) > (?, ?, ?)
+                ORDER BY priority, due_at, id LIMIT ?""",
+                (user_id, *last, chunk_size),
             )
-            notifications = await cursor.fetchall()
-
-        if notifications:
-            for notification in notifications:
-                notification_id, user_id, encrypted_name = notification
-
-                notification_name = decrypt_text(encrypted_name)
-
-                await bot.send_message(user_id, f"Reminder: {notification_name}")
+            for task in tasks:
+                yield _task(task)
+            if len(tasks) < chunk_size:
+                return
+            last = (tasks[-1][4], tasks[-1][5], tasks[-1][0])
 
-                async with aiosqlite.connect(DB_FILE) as db:
-                    await db.execute(
-                        "UPDATE notifications SET is_active = 0 WHERE id = ?",
-                        (notification_id,),
-                    )
-                    await db.commit()
 
-        await asyncio.sleep(60)
-
-
-async def get_tasks(user_id):
-    async with aiosqlite.connect(DB_FILE) as db:
+async def get_due_tasks(user_id, due_by, limit):
+    """Top ``limit`` incomplete tasks due on or before the ISO date ``due_by``,
+    or without a due date."""
+    async with connect() as db:
         tasks = await db.execute_fetchall(
-            """SELECT id, task, description, status
-            FROM tasks WHERE user_id = ? AND status = 0""",
-            (user_id,),
+            f"""SELECT {TASK_COLUMNS} FROM tasks
+            WHERE user_id = ? AND status = 0 AND (due_at <= ? OR due_at = ?)
+            ORDER BY priority, due_at, id LIMIT ?""",
+            (user_id, due_by, NO_DUE_DATE, limit),
         )
-        decrypted_tasks = [
-            (
-                task[0],
-                decrypt_text(task[1]),
-                decrypt_text(task[2]) if task[2] else "",
-                task[3],
-            )
-            for task in tasks
-        ]
-        return decrypted_tasks
+    return [_task(task) for task in tasks]
 
 
 async def get_single_task(task_id):
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
         async with db.execute(
-            "SELECT task, description, status FROM tasks WHERE id = ?", (task_id,)
+            """SELECT task, description, status, priority, due_at
+            FROM tasks WHERE id = ?""",
+            (task_id,),
         ) as cursor:
             task = await cursor.fetchone()
         if task:
@@ -212,40 +267,180 @@ async def get_single_task(task_id):
                 decrypt_text(task[0]),
                 decrypt_text(task[1]) if task[1] else "",
                 task[2],
+                task[3],
+                None if task[4] == NO_DUE_DATE else task[4],
             )
         return None
 
 
-async def update_task_status(task_id, new_status):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
-            "UPDATE tasks SET status = ? WHERE id = ?", (new_status, task_id)
+async def set_task_status(user_id, task_id, expected_status, new_status):
+    """Compare-and-set the status of one of the user's tasks.
+
+    Returns ``(name, new_status)`` if it changed, ``(None, status)`` if the
+    task had another status, and None if the user has no such task."""
+    # single-statement compare-and-set: a repeated tap or a retried update
+    # finds the status already changed and becomes a no-op
+    async with connect() as db:
+        cursor = await db.execute(
+            """UPDATE tasks SET status = ?
+            WHERE id = ? AND user_id = ? AND status = ? RETURNING task""",
+            (new_status, task_id, user_id, expected_status),
+        )
+        task = await cursor.fetchone()
+        await db.commit()
+        if task:
+            return decrypt_text(task[0]), new_status
+        # a miss costs one key lookup, with nothing decrypted
+        cursor = await db.execute(
+            "SELECT status FROM tasks WHERE id = ? AND user_id = ?",
+            (task_id, user_id),
+        )
+        task = await cursor.fetchone()
+    return (None, task[0]) if task else None
+
+
+async def toggle_task_status(user_id, task_id):
+    async with connect() as db:
+        cursor = await db.execute(
+            """UPDATE tasks SET status = 1 - status
+            WHERE id = ? AND user_id = ? RETURNING task, status""",
+            (task_id, user_id),
+        )
+        task = await cursor.fetchone()
+        await db.commit()
+    return (decrypt_text(task[0]), task[1]) if task else None
+
+
+async def set_task_priority(user_id, task_id, priority):
+    async with connect() as db:
+        cursor = await db.execute(
+            "UPDATE tasks SET priority = ? WHERE id = ? AND user_id = ? RETURNING task",
+            (priority, task_id, user_id),
+        )
+        task = await cursor.fetchone()
+        await db.commit()
+    return decrypt_text(task[0]) if task else None
+
+
+async def set_task_due_date(user_id, task_id, due_at):
+    async with connect() as db:
+        cursor = await db.execute(
+            "UPDATE tasks SET due_at = ? WHERE id = ? AND user_id = ? RETURNING task",
+            (due_at or NO_DUE_DATE, task_id, user_id),
         )
+        task = await cursor.fetchone()
         await db.commit()
+    return decrypt_text(task[0]) if task else None
+
+
+async def _index_task(db, user_id, task_id, *texts):
+    await db.execute("DELETE FROM task_tokens WHERE task_id = ?", (task_id,))
+    # a task without indexable words still gets a row, so the backfill does
+    # not decrypt it again on every start; no query hashes to NO_TOKENS
+    hashes = token_hashes(user_id, *texts) or [NO_TOKENS]
+    await db.executemany(
+        "INSERT INTO task_tokens (user_id, token_hash, task_id) VALUES (?, ?, ?)",
+        [(user_id, token_hash, task_id) for token_hash in hashes],
+    )
 
 
 async def set_task_name(task_id, task_name):
     encrypted_task_name = encrypt_text(task_name)
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
-            "UPDATE tasks SET task = ? WHERE id = ?", (encrypted_task_name, task_id)
+    async with connect() as db:
+        cursor = await db.execute(
+            "UPDATE tasks SET task = ? WHERE id = ? RETURNING user_id, description",
+            (encrypted_task_name, task_id),
         )
+        task = await cursor.fetchone()
+        if task:
+            user_id, description = task
+            description = decrypt_text(description) if description else ""
+            await _index_task(db, user_id, task_id, task_name, description)
         await db.commit()
 
 
+def _quota_params(user_id, *values):
+    config = get_config()
+    return {
+        "user_id": user_id,
+        "max_rows": config.quota_max_rows,
+        "max_bytes": config.quota_max_bytes,
+        "size": sum(len(value) for value in values if value),
+    }
+
+
 async def insert_task(user_id, task, description):
     encrypted_task = encrypt_text(task)
-    encrypted_description = encrypt_text(description) if description else ""
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
-            "INSERT INTO tasks (user_id, task, description) VALUES (?, ?, ?)",
-            (user_id, encrypted_task, encrypted_description),
+    encrypted_description = (
+        encrypt_text(description, compress=True) if description else None
+    )
+    params = _quota_params(user_id, encrypted_task, encrypted_description)
+    async with connect() as db:
+        # quota check and insert in one statement, so concurrent inserts of
+        # the same user cannot both slip under the limit
+        cursor = await db.execute(
+            f"""INSERT INTO tasks (user_id, task, description)
+            SELECT :user_id, :task, :description
+            WHERE (SELECT COUNT(*) FROM tasks WHERE user_id = :user_id) < :max_rows
+            AND {USAGE_SQL} + :size <= :max_bytes""",
+            {**params, "task": encrypted_task, "description": encrypted_description},
         )
+        if cursor.rowcount == 0:
+            raise QuotaExceeded(user_id)
+        await _index_task(db, user_id, cursor.lastrowid, task, description)
         await db.commit()
 
 
+async def search_tasks(user_id, query, limit=TASKS_CHUNK_SIZE):
+    hashes = token_hashes(user_id, query)
+    if not hashes:
+        return []
+
+    # every query word must match; only matching rows are read and decrypted
+    placeholders = ", ".join("?" * len(hashes))
+    async with connect() as db:
+        tasks = await db.execute_fetchall(
+            f"""SELECT {TASK_COLUMNS} FROM tasks
+            WHERE user_id = ? AND id IN (
+                SELECT task_id FROM task_tokens
+                WHERE user_id = ? AND token_hash IN ({placeholders})
+                GROUP BY task_id HAVING COUNT(*) = ?)
+            ORDER BY status, priority, due_at, id LIMIT ?""",
+            (user_id, user_id, *hashes, len(hashes), limit),
+        )
+    return [_task(task) for task in tasks]
+
+
+async def backfill_task_tokens(chunk_size=TASKS_CHUNK_SIZE):
+    # one-off indexing of tasks created before the search index existed
+    indexed = 0
+    last_id = 0
+    async with connect() as db:
+        while True:
+            tasks = await db.execute_fetchall(
+                """SELECT id, user_id, task, description FROM tasks
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM task_tokens WHERE task_tokens.task_id = tasks.id)
+                AND id > ? ORDER BY id LIMIT ?""",
+                (last_id, chunk_size),
+            )
+            for task_id, user_id, task, description in tasks:
+                await _index_task(
+                    db,
+                    user_id,
+                    task_id,
+                    decrypt_text(task),
+                    decrypt_text(description) if description else "",
+                )
+            await db.commit()
+            indexed += len(tasks)
+            if len(tasks) < chunk_size:
+                return indexed
+            last_id = tasks[-1][0]
+
+
 async def get_notifications(user_id):
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
         notifications = await db.execute_fetchall(
             """SELECT id, notification_name, notification_date,
             notification_time FROM notifications
@@ -265,7 +460,7 @@ async def get_notifications(user_id):
 
 
 async def get_single_notification(notification_id):
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
         cursor = await db.execute(
             """SELECT notification_name, notification_date, notification_time
             FROM notifications WHERE id = ?""",
@@ -283,24 +478,30 @@ async def insert_notification(
     user_id, notification_name, notification_date, notification_time
 ):
     encrypted_notification_name = encrypt_text(notification_name)
+    params = _quota_params(user_id, encrypted_notification_name)
 
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(
-            """INSERT INTO notifications
+    async with connect() as db:
+        cursor = await db.execute(
+            f"""INSERT INTO notifications
             (user_id, notification_name, notification_date, notification_time)
-            VALUES (?, ?, ?, ?)""",
-            (
-                user_id,
-                encrypted_notification_name,
-                notification_date,
-                notification_time,
-            ),
+            SELECT :user_id, :name, :date, :time
+            WHERE (SELECT COUNT(*) FROM notifications WHERE user_id = :user_id)
+                < :max_rows
+            AND {USAGE_SQL} + :size <= :max_bytes""",
+            {
+                **params,
+                "name": encrypted_notification_name,
+                "date": notification_date,
+                "time": notification_time,
+            },
         )
+        if cursor.rowcount == 0:
+            raise QuotaExceeded(user_id)
         await db.commit()
 
 
 async def update_notification(notification_id, notification_date, notification_time):
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
         await db.execute(
             """UPDATE notifications SET notification_date = ?, 
             notification_time = ? WHERE id = ?""",
@@ -310,7 +511,7 @@ async def update_notification(notification_id, notification_date, notification_t
 
 
 async def disable_notification(notification_id):
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
         await db.execute(
             "UPDATE notifications SET is_active = 0 WHERE id = ?",
             (notification_id,),
@@ -318,20 +519,212 @@ async def disable_notification(notification_id):
         await db.commit()
 
 
-async def task_deletion_scheduler():
-    while True:
-        await clear_tasks()
-        await clear_notifications()
-        await asyncio.sleep(db_clear_period)
-
-
 async def clear_tasks():
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
+        await db.execute(
+            """DELETE FROM task_tokens WHERE task_id IN
+            (SELECT id FROM tasks WHERE status = 1)"""
+        )
         await db.execute("DELETE FROM tasks WHERE status = 1")
         await db.commit()
 
 
 async def clear_notifications():
-    async with aiosqlite.connect(DB_FILE) as db:
+    async with connect() as db:
         await db.execute("DELETE FROM notifications WHERE is_active = 0")
         await db.commit()
+
+
+# Outbox: due deliveries are copied here in the same transaction that marks
+# them fired, then sent and deleted by deliver_outbox. The unique key makes
+# a replayed tick or a second instance enqueue nothing twice.
+async def enqueue_reminders(reminder_time, reminder_date):
+    condition = """reminder_optional = 1 AND reminder_time = :time
+        AND reminder_sent_on IS NOT :date"""
+    params = {"time": reminder_time, "date": reminder_date}
+    async with connect() as db:
+        cursor = await db.execute(
+            f"""INSERT INTO outbox (kind, user_id, ref)
+            SELECT 'reminder', user_id, :date FROM user_settings WHERE {condition}
+            ON CONFLICT DO NOTHING""",
+            params,
+        )
+        await db.execute(
+            f"UPDATE user_settings SET reminder_sent_on = :date WHERE {condition}",
+            params,
+        )
+        await db.commit()
+    return cursor.rowcount
+
+
+async def enqueue_due_notifications(notification_date, notification_time):
+    condition = """notification_date = :date AND notification_time = :time
+        AND is_active = 1"""
+    params = {"date": notification_date, "time": notification_time}
+    async with connect() as db:
+        # the encrypted name is copied as is, nothing is decrypted here
+        cursor = await db.execute(
+            f"""INSERT INTO outbox (kind, user_id, ref, payload)
+            SELECT 'notification', user_id, id, notification_name
+            FROM notifications WHERE {condition}
+            ON CONFLICT DO NOTHING""",
+            params,
+        )
+        await db.execute(
+            f"UPDATE notifications SET is_active = 0 WHERE {condition}", params
+        )
+        await db.commit()
+    return cursor.rowcount
+
+
+async def claim_outbox(now, lease, limit):
+    """Lease up to ``limit`` entries due at ``now`` for ``lease`` seconds.
+
+    An entry that is neither completed nor retried before the lease runs
+    out (e.g. the sender crashed) becomes due again."""
+    async with connect() as db:
+        cursor = await db.execute(
+            """UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?
+            WHERE id IN (
+                SELECT id FROM outbox WHERE next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT ?)
+            RETURNING id, kind, user_id, ref, payload, attempts""",
+            (now + lease, now, limit),
+        )
+        entries = await cursor.fetchall()
+        await db.commit()
+    return [
+        (*entry[:4], decrypt_text(entry[4]) if entry[4] else None, entry[5])
+        for entry in sorted(entries)
+    ]
+
+
+async def complete_outbox(delivered, retries, released=()):
+    """Delete ``delivered`` ids and reschedule ``(id, next_attempt_at)`` pairs
+    in one transaction. ``released`` pairs were claimed but never tried, so
+    their claim does not count as an attempt."""
+    async with connect() as db:
+        if delivered:
+            placeholders = ", ".join("?" * len(delivered))
+            await db.execute(
+                f"DELETE FROM outbox WHERE id IN ({placeholders})", delivered
+            )
+        await db.executemany(
+            "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+            [(next_attempt_at, entry_id) for entry_id, next_attempt_at in retries],
+        )
+        await db.executemany(
+            """UPDATE outbox SET next_attempt_at = ?, attempts = attempts - 1
+            WHERE id = ?""",
+            [(next_attempt_at, entry_id) for entry_id, next_attempt_at in released],
+        )
+        await db.commit()
+
+
+# Lifecycle
+async def get_checkpoints():
+    async with connect() as db:
+        rows = await db.execute_fetchall(
+            "SELECT name, last_tick FROM scheduler_checkpoints"
+        )
+    return dict(rows)
+
+
+async def save_checkpoints(checkpoints):
+    async with connect() as db:
+        await db.executemany(
+            """INSERT INTO scheduler_checkpoints (name, last_tick) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET last_tick = excluded.last_tick""",
+            checkpoints.items(),
+        )
+        await db.commit()
+
+
+async def db_close():
+    # refresh planner statistics while nothing else runs, so the next boot
+    # starts with good query plans
+    async with connect() as db:
+        await db.execute("PRAGMA optimize")
+
+
+async def _payload_size(db):
+    tasks, notifications = [
+        (await db.execute_fetchall(query))[0][0]
+        for query in (
+            """SELECT IFNULL(SUM(LENGTH(task) + IFNULL(LENGTH(description), 0)), 0)
+            FROM tasks""",
+            "SELECT IFNULL(SUM(LENGTH(notification_name)), 0) FROM notifications",
+        )
+    ]
+    return tasks + notifications
+
+
+async def _has_text_payloads(db):
+    rows = await db.execute_fetchall(
+        """SELECT EXISTS (SELECT 1 FROM tasks
+            WHERE typeof(task) = 'text' OR typeof(description) = 'text')
+        OR EXISTS (SELECT 1 FROM notifications
+            WHERE typeof(notification_name) = 'text')"""
+    )
+    return bool(rows[0][0])
+
+
+def _compact_value(column, value):
+    if not value:
+        return None
+    if isinstance(value, str):
+        return encrypt_text(decrypt_text(value), compress=column == "description")
+    return value
+
+
+async def _compact_rows(db, table, columns, chunk_size):
+    # rows are converted in short transactions and compare-and-set on the old
+    # value, so handlers keep working and concurrent edits are not clobbered
+    converted = 0
+    last_id = 0
+    column_list = ", ".join(columns)
+    typed = " OR ".join(f"typeof({column}) = 'text'" for column in columns)
+    while True:
+        rows = await db.execute_fetchall(
+            f"""SELECT id, {column_list} FROM {table}
+            WHERE id > ? AND ({typed}) ORDER BY id LIMIT ?""",
+            (last_id, chunk_size),
+        )
+        for row_id, *values in rows:
+            new_values = [
+                _compact_value(column, value) for column, value in zip(columns, values)
+            ]
+            assignments = ", ".join(f"{column} = ?" for column in columns)
+            matches = " AND ".join(f"{column} IS ?" for column in columns)
+            cursor = await db.execute(
+                f"UPDATE {table} SET {assignments} WHERE id = ? AND {matches}",
+                (*new_values, row_id, *values),
+            )
+            converted += cursor.rowcount
+        await db.commit()
+        await asyncio.sleep(0)
+        if len(rows) < chunk_size:
+            return converted
+        last_id = rows[-1][0]
+
+
+async def compact_storage(chunk_size=TASKS_CHUNK_SIZE):
+    """Convert legacy base64 TEXT tokens to compact BLOBs.
+
+    Returns ``(rows converted, bytes before, bytes after)`` of encrypted
+    payload, with both sizes None when there was nothing to convert. The
+    file itself only shrinks by that much after a VACUUM; until then the
+    freed space is reused for new rows."""
+    async with connect() as db:
+        # the size passes read every row; skip them once nothing is left
+        if not await _has_text_payloads(db):
+            return 0, None, None
+        size_before = await _payload_size(db)
+        converted = await _compact_rows(
+            db, "tasks", ("task", "description"), chunk_size
+        )
+        converted += await _compact_rows(
+            db, "notifications", ("notification_name",), chunk_size
+        )
+        size_after = await _payload_size(db)
+    return converted, size_before, size_after
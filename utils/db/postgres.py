@@ -0,0 +1,516 @@
+import asyncpg
+
+from config import get_config
+from utils.db.backend import StorageBackend
+from utils.db.crypto import decode_compact, encode_compact
+from utils.db.db import (
+    NO_DUE_DATE,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    TASKS_CHUNK_SIZE,
+    QuotaExceeded,
+)
+from utils.db.search import token_hashes
+
+# Same tables as the SQLite backend, with payloads always stored as compact
+# BYTEA tokens (there are no legacy rows to stay compatible with). asyncpg
+# prepares and caches every statement per connection, so repeated queries
+# skip parsing and planning.
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS tasks (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    task BYTEA NOT NULL,
+    description BYTEA,
+    status SMALLINT NOT NULL DEFAULT 0
+);
+ALTER TABLE tasks
+    ADD COLUMN IF NOT EXISTS priority SMALLINT NOT NULL DEFAULT {PRIORITY_NORMAL},
+    ADD COLUMN IF NOT EXISTS due_at TEXT NOT NULL DEFAULT '{NO_DUE_DATE}';
+-- NOT VALID: enforced on every write without failing on older rows
+DO $$ BEGIN
+    ALTER TABLE tasks ADD CONSTRAINT tasks_priority_check
+        CHECK (priority IN ({PRIORITY_HIGH}, {PRIORITY_NORMAL}, {PRIORITY_LOW}))
+        NOT VALID;
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+CREATE INDEX IF NOT EXISTS tasks_user_order
+    ON tasks (user_id, status, priority, due_at, id);
+DROP INDEX IF EXISTS tasks_user_id;
+
+CREATE TABLE IF NOT EXISTS user_settings (
+    user_id BIGINT PRIMARY KEY,
+    description_optional SMALLINT NOT NULL DEFAULT 0,
+    reminder_optional SMALLINT NOT NULL DEFAULT 0,
+    reminder_time TEXT,
+    language TEXT,
+    reminder_sent_on TEXT
+);
+CREATE INDEX IF NOT EXISTS user_settings_reminder_time
+    ON user_settings (reminder_time) WHERE reminder_optional = 1;
+
+CREATE TABLE IF NOT EXISTS notifications (
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    notification_name BYTEA NOT NULL,
+    notification_date TEXT,
+    notification_time TEXT,
+    is_active SMALLINT NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS notifications_user_id ON notifications (user_id);
+CREATE INDEX IF NOT EXISTS notifications_due
+    ON notifications (notification_date, notification_time) WHERE is_active = 1;
+
+CREATE TABLE IF NOT EXISTS task_tokens (
+    user_id BIGINT NOT NULL,
+    token_hash BYTEA NOT NULL,
+    task_id BIGINT NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+    PRIMARY KEY (user_id, token_hash, task_id)
+);
+CREATE INDEX IF NOT EXISTS task_tokens_task_id ON task_tokens (task_id);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGSERIAL PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id BIGINT NOT NULL,
+    ref TEXT NOT NULL,
+    payload BYTEA,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+    UNIQUE (kind, user_id, ref)
+);
+CREATE INDEX IF NOT EXISTS outbox_next_attempt_at ON outbox (next_attempt_at);
+
+CREATE TABLE IF NOT EXISTS scheduler_checkpoints (
+    name TEXT PRIMARY KEY,
+    last_tick DOUBLE PRECISION NOT NULL
+);
+"""
+
+USAGE_SQL = """(SELECT COALESCE(SUM(octet_length(task)
+        + COALESCE(octet_length(description), 0)), 0)
+    FROM tasks WHERE user_id = $1)
+    + (SELECT COALESCE(SUM(octet_length(notification_name)), 0)
+    FROM notifications WHERE user_id = $1)"""
+
+
+def _row_id(value):
+    # ids come from callback data and command arguments as strings
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+TASK_COLUMNS = "id, task, description, status, priority, due_at"
+
+
+def _due_at(value):
+    return None if value == NO_DUE_DATE else value
+
+
+def _task(row):
+    return (
+        row["id"],
+        decode_compact(row["task"]),
+        decode_compact(row["description"]) if row["description"] else "",
+        row["status"],
+        row["priority"],
+        _due_at(row["due_at"]),
+    )
+
+
+class PostgresBackend(StorageBackend):
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.pool = None
+
+    async def init(self):
+        config = get_config()
+        self.pool = await asyncpg.create_pool(
+            self.dsn, min_size=config.db_pool_min, max_size=config.db_pool_max
+        )
+        async with self.pool.acquire() as connection:
+            await connection.execute(SCHEMA)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def _check_quota(self, connection, user_id, table, size):
+        # serializes inserts of one user, so two of them cannot both pass
+        await connection.execute("SELECT pg_advisory_xact_lock($1)", user_id)
+        config = get_config()
+        rows, used = await connection.fetchrow(
+            f"""SELECT (SELECT COUNT(*) FROM {table} WHERE user_id = $1),
+            {USAGE_SQL}""",
+            user_id,
+        )
+        if rows >= config.quota_max_rows or used + size > config.quota_max_bytes:
+            raise QuotaExceeded(user_id)
+
+    # settings
+    async def get_user_settings(self, user_id):
+        settings = await self.pool.fetchrow(
+            """SELECT description_optional, reminder_optional, reminder_time
+            FROM user_settings WHERE user_id = $1""",
+            user_id,
+        )
+        if settings is None:
+            await self.pool.execute(
+                """INSERT INTO user_settings (user_id) VALUES ($1)
+                ON CONFLICT (user_id) DO NOTHING""",
+                user_id,
+            )
+            settings = (0, 0, None)
+        return {
+            "description_optional": settings[0],
+            "reminder_optional": settings[1],
+            "reminder_time": settings[2],
+        }
+
+    async def _toggle_setting(self, user_id, column):
+        return await self.pool.fetchval(
+            f"""INSERT INTO user_settings (user_id, {column}) VALUES ($1, 1)
+            ON CONFLICT (user_id) DO UPDATE
+            SET {column} = 1 - user_settings.{column}
+            RETURNING {column}""",
+            user_id,
+        )
+
+    async def toggle_description_optional(self, user_id):
+        return await self._toggle_setting(user_id, "description_optional")
+
+    async def toggle_reminder_optional(self, user_id):
+        return await self._toggle_setting(user_id, "reminder_optional")
+
+    async def update_reminder_time(self, user_id, reminder_time):
+        await self.pool.execute(
+            "UPDATE user_settings SET reminder_time = $2 WHERE user_id = $1",
+            user_id,
+            reminder_time,
+        )
+
+    async def save_reminder_times(self, rows):
+        await self.pool.executemany(
+            """INSERT INTO user_settings (user_id, reminder_time) VALUES ($1, $2)
+            ON CONFLICT (user_id) DO UPDATE SET
+            reminder_time = EXCLUDED.reminder_time""",
+            rows,
+        )
+
+    async def get_user_language(self, user_id):
+        return await self.pool.fetchval(
+            "SELECT language FROM user_settings WHERE user_id = $1", user_id
+        )
+
+    async def set_user_language(self, user_id, language):
+        await self.pool.execute(
+            """INSERT INTO user_settings (user_id, language) VALUES ($1, $2)
+            ON CONFLICT (user_id) DO UPDATE SET language = EXCLUDED.language""",
+            user_id,
+            language,
+        )
+
+    # tasks
+    async def iter_tasks(self, user_id, chunk_size=TASKS_CHUNK_SIZE):
+        last = (PRIORITY_HIGH - 1, "", 0)
+        while True:
+            rows = await self.pool.fetch(
+                f"""SELECT {TASK_COLUMNS} FROM tasks
+                WHERE user_id = $1 AND status = 0
+                AND (priority, due_at, id) > ($2, $3, $4)
+                ORDER BY priority, due_at, id LIMIT $5""",
+                user_id,
+                *last,
+                chunk_size,
+            )
+            for row in rows:
+                yield _task(row)
+            if len(rows) < chunk_size:
+                return
+            last = (rows[-1]["priority"], rows[-1]["due_at"], rows[-1]["id"])
+
+    async def get_due_tasks(self, user_id, due_by, limit):
+        rows = await self.pool.fetch(
+            f"""SELECT {TASK_COLUMNS} FROM tasks
+            WHERE user_id = $1 AND status = 0 AND (due_at <= $2 OR due_at = $3)
+            ORDER BY priority, due_at, id LIMIT $4""",
+            user_id,
+            due_by,
+            NO_DUE_DATE,
+            limit,
+        )
+        return [_task(row) for row in rows]
+
+    async def get_single_task(self, task_id):
+        row = await self.pool.fetchrow(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE id = $1", _row_id(task_id)
+        )
+        return _task(row)[1:] if row else None
+
+    async def _set_task_field(self, user_id, task_id, column, value):
+        task = await self.pool.fetchval(
+            f"""UPDATE tasks SET {column} = $3
+            WHERE id = $1 AND user_id = $2 RETURNING task""",
+            _row_id(task_id),
+            user_id,
+            value,
+        )
+        return decode_compact(task) if task else None
+
+    async def set_task_priority(self, user_id, task_id, priority):
+        return await self._set_task_field(user_id, task_id, "priority", priority)
+
+    async def set_task_due_date(self, user_id, task_id, due_at):
+        return await self._set_task_field(
+            user_id, task_id, "due_at", due_at or NO_DUE_DATE
+        )
+
+    async def _index_task(self, connection, user_id, task_id, *texts):
+        await connection.execute("DELETE FROM task_tokens WHERE task_id = $1", task_id)
+        hashes = token_hashes(user_id, *texts)
+        await connection.executemany(
+            """INSERT INTO task_tokens (user_id, token_hash, task_id)
+            VALUES ($1, $2, $3) ON CONFLICT DO NOTHING""",
+            [(user_id, token_hash, task_id) for token_hash in hashes],
+        )
+
+    async def insert_task(self, user_id, task, description):
+        encrypted_task = encode_compact(task)
+        encrypted_description = (
+            encode_compact(description, compress=True) if description else None
+        )
+        size = len(encrypted_task) + len(encrypted_description or b"")
+        async with self.pool.acquire() as connection, connection.transaction():
+            await self._check_quota(connection, user_id, "tasks", size)
+            task_id = await connection.fetchval(
+                """INSERT INTO tasks (user_id, task, description)
+                VALUES ($1, $2, $3) RETURNING id""",
+                user_id,
+                encrypted_task,
+                encrypted_description,
+            )
+            await self._index_task(connection, user_id, task_id, task, description)
+
+    async def set_task_name(self, task_id, task_name):
+        async with self.pool.acquire() as connection, connection.transaction():
+            row = await connection.fetchrow(
+                """UPDATE tasks SET task = $2 WHERE id = $1
+                RETURNING id, user_id, description""",
+                _row_id(task_id),
+                encode_compact(task_name),
+            )
+            if row:
+                description = row["description"]
+                description = decode_compact(description) if description else ""
+                await self._index_task(
+                    connection, row["user_id"], row["id"], task_name, description
+                )
+
+    async def set_task_status(self, user_id, task_id, expected_status, new_status):
+        # the outer SELECT sees the row as it was before the update
+        row = await self.pool.fetchrow(
+            """WITH updated AS (
+                UPDATE tasks SET status = $4
+                WHERE id = $1 AND user_id = $2 AND status = $3 RETURNING task)
+            SELECT (SELECT task FROM updated) AS task, status
+            FROM tasks WHERE id = $1 AND user_id = $2""",
+            _row_id(task_id),
+            user_id,
+            expected_status,
+            new_status,
+        )
+        if row is None:
+            return None
+        if row["task"] is None:
+            return None, row["status"]
+        return decode_compact(row["task"]), new_status
+
+    async def toggle_task_status(self, user_id, task_id):
+        row = await self.pool.fetchrow(
+            """UPDATE tasks SET status = 1 - status
+            WHERE id = $1 AND user_id = $2 RETURNING task, status""",
+            _row_id(task_id),
+            user_id,
+        )
+        return (decode_compact(row["task"]), row["status"]) if row else None
+
+    async def search_tasks(self, user_id, query, limit=TASKS_CHUNK_SIZE):
+        hashes = token_hashes(user_id, query)
+        if not hashes:
+            return []
+        rows = await self.pool.fetch(
+            f"""SELECT {TASK_COLUMNS} FROM tasks
+            WHERE user_id = $1 AND id IN (
+                SELECT task_id FROM task_tokens
+                WHERE user_id = $1 AND token_hash = ANY($2::bytea[])
+                GROUP BY task_id HAVING COUNT(*) = $3)
+            ORDER BY status, priority, due_at, id LIMIT $4""",
+            user_id,
+            hashes,
+            len(hashes),
+            limit,
+        )
+        return [_task(row) for row in rows]
+
+    async def clear_tasks(self):
+        # task_tokens rows go with their task (ON DELETE CASCADE)
+        await self.pool.execute("DELETE FROM tasks WHERE status = 1")
+
+    # notifications
+    async def get_notifications(self, user_id):
+        rows = await self.pool.fetch(
+            """SELECT id, notification_name, notification_date, notification_time
+            FROM notifications WHERE user_id = $1 AND is_active = 1""",
+            user_id,
+        )
+        return [
+            (
+                row["id"],
+                decode_compact(row["notification_name"]),
+                row["notification_date"],
+                row["notification_time"],
+            )
+            for row in rows
+        ]
+
+    async def get_single_notification(self, notification_id):
+        row = await self.pool.fetchrow(
+            """SELECT notification_name, notification_date, notification_time
+            FROM notifications WHERE id = $1""",
+            _row_id(notification_id),
+        )
+        if row:
+            return (
+                decode_compact(row["notification_name"]),
+                row["notification_date"],
+                row["notification_time"],
+            )
+        return None
+
+    async def insert_notification(
+        self, user_id, notification_name, notification_date, notification_time
+    ):
+        encrypted_name = encode_compact(notification_name)
+        async with self.pool.acquire() as connection, connection.transaction():
+            await self._check_quota(
+                connection, user_id, "notifications", len(encrypted_name)
+            )
+            await connection.execute(
+                """INSERT INTO notifications
+                (user_id, notification_name, notification_date, notification_time)
+                VALUES ($1, $2, $3, $4)""",
+                user_id,
+                encrypted_name,
+                notification_date,
+                notification_time,
+            )
+
+    async def update_notification(
+        self, notification_id, notification_date, notification_time
+    ):
+        await self.pool.execute(
+            """UPDATE notifications SET notification_date = $2,
+            notification_time = $3 WHERE id = $1""",
+            _row_id(notification_id),
+            notification_date,
+            notification_time,
+        )
+
+    async def disable_notification(self, notification_id):
+        await self.pool.execute(
+            "UPDATE notifications SET is_active = 0 WHERE id = $1",
+            _row_id(notification_id),
+        )
+
+    async def clear_notifications(self):
+        await self.pool.execute("DELETE FROM notifications WHERE is_active = 0")
+
+    # outbox
+    async def enqueue_reminders(self, reminder_time, reminder_date):
+        # one statement: marking and enqueueing commit or fail together
+        status = await self.pool.execute(
+            """WITH fired AS (
+                UPDATE user_settings SET reminder_sent_on = $2
+                WHERE reminder_optional = 1 AND reminder_time = $1
+                AND reminder_sent_on IS DISTINCT FROM $2
+                RETURNING user_id)
+            INSERT INTO outbox (kind, user_id, ref)
+            SELECT 'reminder', user_id, $2 FROM fired
+            ON CONFLICT DO NOTHING""",
+            reminder_time,
+            reminder_date,
+        )
+        return int(status.split()[-1])
+
+    async def enqueue_due_notifications(self, notification_date, notification_time):
+        status = await self.pool.execute(
+            """WITH fired AS (
+                UPDATE notifications SET is_active = 0
+                WHERE notification_date = $1 AND notification_time = $2
+                AND is_active = 1
+                RETURNING id, user_id, notification_name)
+            INSERT INTO outbox (kind, user_id, ref, payload)
+            SELECT 'notification', user_id, id::text, notification_name FROM fired
+            ON CONFLICT DO NOTHING""",
+            notification_date,
+            notification_time,
+        )
+        return int(status.split()[-1])
+
+    async def claim_outbox(self, now, lease, limit):
+        # SKIP LOCKED lets several senders lease disjoint batches
+        rows = await self.pool.fetch(
+            """UPDATE outbox SET attempts = attempts + 1, next_attempt_at = $1
+            WHERE id IN (
+                SELECT id FROM outbox WHERE next_attempt_at <= $2
+                ORDER BY next_attempt_at, id LIMIT $3
+                FOR UPDATE SKIP LOCKED)
+            RETURNING id, kind, user_id, ref, payload, attempts""",
+            now + lease,
+            now,
+            limit,
+        )
+        return sorted(
+            (
+                row["id"],
+                row["kind"],
+                row["user_id"],
+                row["ref"],
+                decode_compact(row["payload"]) if row["payload"] else None,
+                row["attempts"],
+            )
+            for row in rows
+        )
+
+    async def complete_outbox(self, delivered, retries, released=()):
+        async with self.pool.acquire() as connection, connection.transaction():
+            if delivered:
+                await connection.execute(
+                    "DELETE FROM outbox WHERE id = ANY($1::bigint[])", delivered
+                )
+            await connection.executemany(
+                "UPDATE outbox SET next_attempt_at = $2 WHERE id = $1", retries
+            )
+            await connection.executemany(
+                """UPDATE outbox SET next_attempt_at = $2, attempts = attempts - 1
+                WHERE id = $1""",
+                released,
+            )
+
+    # lifecycle
+    async def get_checkpoints(self):
+        rows = await self.pool.fetch(
+            "SELECT name, last_tick FROM scheduler_checkpoints"
+        )
+        return {row["name"]: row["last_tick"] for row in rows}
+
+    async def save_checkpoints(self, checkpoints):
+        await self.pool.executemany(
+            """INSERT INTO scheduler_checkpoints (name, last_tick) VALUES ($1, $2)
+            ON CONFLICT (name) DO UPDATE SET last_tick = EXCLUDED.last_tick""",
+            checkpoints.items(),
+        )
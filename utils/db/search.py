@@ -0,0 +1,54 @@
+import hashlib
+import hmac
+import re
+import unicodedata
+from functools import lru_cache
+
+from config import get_config
+from utils.db.crypto import get_encryption_key
+
+# Blind index: tasks stay encrypted, and every normalized word is stored as a
+# keyed hash. A query is hashed the same way and matched with an index lookup,
+# so only matching rows are ever read and decrypted. The user id is part of
+# the hashed message, so equal words of different users do not collide.
+
+TOKEN_RE = re.compile(r"\w+")
+MIN_TOKEN_LENGTH = 2
+MAX_TOKENS_PER_TASK = 64
+HASH_SIZE = 16
+
+
+@lru_cache(maxsize=None)
+def get_index_key():
+    config = get_config()
+    if config.search_key:
+        return config.search_key.encode()
+    return hmac.new(get_encryption_key(), b"task-search-index", "sha256").digest()
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    tokens = dict.fromkeys(
+        token for token in TOKEN_RE.findall(text) if len(token) >= MIN_TOKEN_LENGTH
+    )
+    return list(tokens)[:MAX_TOKENS_PER_TASK]
+
+
+def ignored_words(text):
+    """Query words too short to be indexed, so a search cannot use them."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return list(
+        dict.fromkeys(
+            token for token in TOKEN_RE.findall(text) if len(token) < MIN_TOKEN_LENGTH
+        )
+    )
+
+
+def hash_token(user_id, token):
+    message = f"{user_id}:{token}".encode()
+    return hmac.new(get_index_key(), message, hashlib.sha256).digest()[:HASH_SIZE]
+
+
+def token_hashes(user_id, *texts):
+    tokens = dict.fromkeys(token for text in texts for token in tokenize(text))
+    return [hash_token(user_id, token) for token in tokens]
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from utils.db.backend import storage
+
+
+class _Entry:
+    __slots__ = ("settings", "used")
+
+    def __init__(self, settings, now):
+        self.settings = settings
+        self.used = now
+
+
+class SettingsCache:
+    """Write-behind cache of user settings.
+
+    A user's row is read once and then served from memory. Toggles are
+    flipped atomically in the database and the cache takes the returned
+    value; reminder times are changed in memory and ``flush`` writes them
+    back in a single batch. Clean entries idle for ``idle_ttl`` seconds, or
+    beyond ``max_users``, are dropped on flush."""
+
+    def __init__(self, idle_ttl=1800, max_users=10000):
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.flushed = 0
+
+        self._entries = OrderedDict()
+        self._dirty = set()
+        self._flush_lock = asyncio.Lock()
+
+    async def _entry(self, user_id):
+        entry = self._entries.get(user_id)
+        now = time.monotonic()
+        if entry is None:
+            settings = await storage.get_user_settings(user_id)
+            # a concurrent load may have finished (and changed it) first
+            entry = self._entries.setdefault(user_id, _Entry(settings, now))
+        entry.used = now
+        self._entries.move_to_end(user_id)
+        return entry
+
+    async def get_user_settings(self, user_id):
+        return dict((await self._entry(user_id)).settings)
+
+    async def _toggle(self, user_id, key, toggle):
+        entry = await self._entry(user_id)
+        # flipped in SQL, so concurrent toggles (or other instances) never
+        # lose an update; the flush does not write these columns
+        entry.settings[key] = await toggle(user_id)
+        return entry.settings[key]
+
+    async def toggle_description_optional(self, user_id):
+        return await self._toggle(
+            user_id, "description_optional", storage.toggle_description_optional
+        )
+
+    async def toggle_reminder_optional(self, user_id):
+        return await self._toggle(
+            user_id, "reminder_optional", storage.toggle_reminder_optional
+        )
+
+    async def update_reminder_time(self, user_id, reminder_time):
+        entry = await self._entry(user_id)
+        entry.settings["reminder_time"] = reminder_time
+        self._dirty.add(user_id)
+
+    def _evict(self, now):
+        for user_id, entry in list(self._entries.items()):
+            if (
+                len(self._entries) <= self.max_users
+                and now - entry.used < self.idle_ttl
+            ):
+                break
+            if user_id not in self._dirty:
+                del self._entries[user_id]
+
+    async def flush(self, tick=None):
+        async with self._flush_lock:
+            if self._dirty:
+                dirty, self._dirty = self._dirty, set()
+                rows = [
+                    (user_id, self._entries[user_id].settings["reminder_time"])
+                    for user_id in dirty
+                ]
+                try:
+                    await storage.save_reminder_times(rows)
+                except BaseException:
+                    # keep them for the next flush; changes made meanwhile
+                    # are already marked again
+                    self._dirty |= dirty
+                    raise
+                self.flushed += len(rows)
+            self._evict(time.monotonic())
+
+
+settings = SettingsCache()
@@ -1,29 +1,48 @@
+from functools import lru_cache
+
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-from utils.db.db import get_user_settings
+from utils.db.settings_cache import settings
+from utils.i18n import get_i18n
 
 
-async def generate_settings_menu(user_id):
-    user_settings = await get_user_settings(user_id)
-    description_optional = user_settings["description_optional"]
-    reminder_optional = user_settings["reminder_optional"]
+@lru_cache(maxsize=None)
+def settings_menu(locale, description_optional, reminder_optional):
+    _ = get_i18n().translator(locale)
 
     description_text = (
-        "Turn on tasks descriptions 📖"
+        _("turn_on_descriptions")
         if description_optional
-        else "Turn off tasks descriptions 📖"
+        else _("turn_off_descriptions")
     )
     reminder_text = (
-        "Turn off tasks reminder ⏰"
+        _("turn_off_reminder")
         if reminder_optional
-        else "Turn on tasks reminder ⏰"
+        else _("turn_on_reminder")
     )
 
     return ReplyKeyboardMarkup(
         keyboard=[
             [KeyboardButton(text=description_text), KeyboardButton(text=reminder_text)],
-            [KeyboardButton(text="Back 🔙")],
+            [KeyboardButton(text=_("language_button"))],
+            [KeyboardButton(text=_("back_button"))],
         ],
         resize_keyboard=True,
         one_time_keyboard=False,
-        input_field_placeholder="Settings",
+        input_field_placeholder=_("settings_placeholder"),
+    )
+
+
+def build_settings_menus():
+    for locale in get_i18n().locales:
+        for description_optional in (False, True):
+            for reminder_optional in (False, True):
+                settings_menu(locale, description_optional, reminder_optional)
+
+
+async def generate_settings_menu(user_id, locale):
+    user_settings = await settings.get_user_settings(user_id)
+    return settings_menu(
+        locale,
+        bool(user_settings["description_optional"]),
+        bool(user_settings["reminder_optional"]),
     )
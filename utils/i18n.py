@@ -0,0 +1,120 @@
+import gettext
+from collections import OrderedDict
+from functools import lru_cache, partial
+from pathlib import Path
+from types import MappingProxyType
+
+from aiogram import BaseMiddleware
+
+from utils.db.backend import storage
+
+LOCALES_DIR = Path(__file__).resolve().parent.parent / "locales"
+DOMAIN = "bot"
+DEFAULT_LOCALE = "en"
+LANGUAGE_CACHE_SIZE = 10000
+
+
+def normalize(text):
+    return " ".join(text.split()).casefold() if text else ""
+
+
+def load_catalogs(locales_dir=LOCALES_DIR, domain=DOMAIN):
+    catalogs = {}
+    for mo_file in sorted(locales_dir.glob(f"*/LC_MESSAGES/{domain}.mo")):
+        with mo_file.open("rb") as fp:
+            translations = gettext.GNUTranslations(fp)
+        catalog = {
+            msgid: text for msgid, text in translations._catalog.items() if msgid
+        }
+        catalogs[mo_file.parent.parent.name] = MappingProxyType(catalog)
+    return MappingProxyType(catalogs)
+
+
+class I18n:
+    """Compiled catalogs, a reverse map for button texts and per-user locales.
+
+    Everything but the language cache is immutable after construction, so
+    lookups in handlers are plain dict reads."""
+
+    def __init__(self, catalogs, default_locale=DEFAULT_LOCALE):
+        if default_locale not in catalogs:
+            raise ValueError(f"No catalog for default locale {default_locale!r}")
+        self.catalogs = catalogs
+        self.default_locale = default_locale
+        self.locales = tuple(catalogs)
+
+        # normalized text in any locale -> msgid, so filters can match a
+        # button press without knowing the user's language
+        reverse = {}
+        for catalog in catalogs.values():
+            for msgid, text in catalog.items():
+                reverse.setdefault(normalize(text), msgid)
+        self._reverse = MappingProxyType(reverse)
+
+        self._translators = {
+            locale: partial(self.gettext, locale=locale) for locale in catalogs
+        }
+        self._languages = OrderedDict()
+
+    def gettext(self, msgid, locale):
+        catalog = self.catalogs.get(locale) or self.catalogs[self.default_locale]
+        return catalog.get(msgid) or self.catalogs[self.default_locale].get(
+            msgid, msgid
+        )
+
+    def translator(self, locale):
+        return self._translators.get(locale) or self._translators[self.default_locale]
+
+    def key_of(self, text):
+        return self._reverse.get(normalize(text))
+
+    def match_locale(self, language_code):
+        if language_code:
+            language = language_code.split("-")[0].lower()
+            if language in self.catalogs:
+                return language
+        return self.default_locale
+
+    def remember(self, user_id, locale):
+        self._languages[user_id] = locale
+        self._languages.move_to_end(user_id)
+        if len(self._languages) > LANGUAGE_CACHE_SIZE:
+            self._languages.popitem(last=False)
+
+    async def locale_for(self, user_id, language_code=None):
+        locale = self._languages.get(user_id)
+        if locale is not None:
+            self._languages.move_to_end(user_id)
+            return locale
+
+        stored = await storage.get_user_language(user_id)
+        locale = (
+            stored if stored in self.catalogs else self.match_locale(language_code)
+        )
+        self.remember(user_id, locale)
+        return locale
+
+
+@lru_cache(maxsize=None)
+def get_i18n():
+    return I18n(load_catalogs())
+
+
+def button(*msgids):
+    """Message filter matching a button label in any locale."""
+    return lambda message: get_i18n().key_of(message.text) in msgids
+
+
+class I18nMiddleware(BaseMiddleware):
+    """Injects ``locale`` and a bound ``_`` translator into handler data."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        i18n = get_i18n()
+        if user is not None:
+            locale = await i18n.locale_for(user.id, user.language_code)
+        else:
+            locale = i18n.default_locale
+        data["locale"] = locale
+        data["_"] = i18n.translator(locale)
+        return await handler(event, data)
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import signal
+import time
+from contextlib import suppress
+
+logger = logging.getLogger(__name__)
+
+# closing connections must happen even when draining used up the deadline
+MIN_STEP_TIMEOUT = 2
+
+
+class Lifecycle:
+    """Signal handling and an ordered shutdown under one deadline.
+
+    Steps registered with ``on_shutdown`` run in order once polling has
+    stopped. A step that fails or runs past the deadline is logged and
+    cancelled, and the next one still runs."""
+
+    def __init__(self, deadline=20):
+        self.deadline = deadline
+        self.stopping = False
+        self._steps = []
+        self._stop_task = None
+
+    def install_signal_handlers(self, on_stop, signals=(signal.SIGTERM, signal.SIGINT)):
+        loop = asyncio.get_running_loop()
+        for sig in signals:
+            # not available on Windows
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, self._on_signal, sig, on_stop)
+
+    def _on_signal(self, sig, on_stop):
+        if self.stopping:
+            logger.warning("Got %s again, still shutting down", sig.name)
+            return
+        logger.info("Got %s, shutting down", sig.name)
+        self.stopping = True
+        self._stop_task = asyncio.create_task(on_stop())
+
+    def on_shutdown(self, name, func):
+        self._steps.append((name, func))
+
+    async def shutdown(self):
+        self.stopping = True
+        deadline = time.monotonic() + self.deadline
+        for name, func in self._steps:
+            started = time.monotonic()
+            timeout = max(deadline - started, MIN_STEP_TIMEOUT)
+            try:
+                await asyncio.wait_for(func(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Shutdown: %s cut off after %.1f s", name, timeout)
+            except Exception:
+                logger.exception("Shutdown: %s failed", name)
+            else:
+                logger.info(
+                    "Shutdown: %s done in %.0f ms",
+                    name,
+                    (time.monotonic() - started) * 1000,
+                )
+
+
+async def cancel_and_wait(task):
+    task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
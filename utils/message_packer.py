@@ -0,0 +1,57 @@
+# Telegram limits: 4096 characters per message text, and inline keyboards
+# become unusable (and get rejected) well before ~100 buttons.
+MESSAGE_LIMIT = 4096
+KEYBOARD_ROWS_LIMIT = 30
+
+
+def _split_long_line(line, limit):
+    return [line[i : i + limit] for i in range(0, len(line), limit)]
+
+
+async def pack_lines(lines, header=None, limit=MESSAGE_LIMIT):
+    """Pack an async iterable of lines into message texts under ``limit``.
+
+    Each message is yielded as soon as the next line would not fit, so the
+    first message can be sent while the source is still being read. Nothing is
+    yielded for an empty source, including the header."""
+    buffer = []
+    size = 0
+    first = True
+
+    async for line in lines:
+        parts = _split_long_line(line, limit)
+        if first and header:
+            buffer.append(header)
+            size = len(header)
+            # a long first line is split around the header, so the header
+            # never goes out as a message of its own
+            room = limit - size - 1
+            if 0 < room < len(line):
+                parts = [line[:room]] + _split_long_line(line[room:], limit)
+        first = False
+
+        for part in parts or [""]:
+            extra = len(part) + (1 if buffer else 0)
+            if buffer and size + extra > limit:
+                yield "\n".join(buffer)
+                buffer = []
+                size = 0
+                extra = len(part)
+            buffer.append(part)
+            size += extra
+
+    if buffer:
+        yield "\n".join(buffer)
+
+
+async def pack_rows(rows, limit=KEYBOARD_ROWS_LIMIT):
+    """Group an async iterable of keyboard rows into chunks of at most ``limit``."""
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= limit:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
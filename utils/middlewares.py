@@ -0,0 +1,173 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Update
+
+from utils.work import Overloaded
+
+
+class _UserState:
+    __slots__ = ("tokens", "updated", "last_callback", "last_callback_at")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.last_callback = None
+        self.last_callback_at = 0.0
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Anti-flood outer middleware for messages and callback queries.
+
+    Every user gets a token bucket refilled at ``rate`` tokens per second up to
+    ``burst``; identical callbacks repeated within ``debounce`` seconds are
+    dropped. Rejections happen before any filter or handler runs, so they never touch
+    the database. Idle users are evicted after ``idle_ttl`` seconds and the
+    table never grows beyond ``max_users`` entries."""
+
+    def __init__(
+        self,
+        rate=1.0,
+        burst=5,
+        debounce=1.0,
+        idle_ttl=600,
+        max_users=10000,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.debounce = debounce
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.rejected = 0
+
+        self._users = OrderedDict()
+
+    def _evict(self, now):
+        users = self._users
+        while users:
+            user_id, state = next(iter(users.items()))
+            if len(users) <= self.max_users and now - state.updated < self.idle_ttl:
+                break
+            del users[user_id]
+
+    def _allow(self, user_id, callback_data, now):
+        state = self._users.get(user_id)
+        if state is None:
+            state = _UserState(self.burst, now)
+            self._users[user_id] = state
+        else:
+            self._users.move_to_end(user_id)
+            state.tokens = min(
+                self.burst, state.tokens + (now - state.updated) * self.rate
+            )
+            state.updated = now
+        self._evict(now)
+
+        if callback_data is not None:
+            if (
+                callback_data == state.last_callback
+                and now - state.last_callback_at < self.debounce
+            ):
+                return False
+            state.last_callback = callback_data
+            state.last_callback_at = now
+
+        if state.tokens < 1:
+            return False
+        state.tokens -= 1
+        return True
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None:
+            is_callback = isinstance(event, CallbackQuery)
+            callback_data = event.data if is_callback else None
+            if not self._allow(user.id, callback_data, time.monotonic()):
+                self.rejected += 1
+                if is_callback:
+                    # stop the client-side spinner; it's a single API call
+                    await event.answer()
+                return None
+        return await handler(event, data)
+
+
+class WorkMiddleware(BaseMiddleware):
+    """Runs handlers in a slot of the work scheduler's ``priority`` class, so
+    they start ahead of queued scheduler work. Updates refused under overload
+    are dropped like throttled ones."""
+
+    def __init__(self, work, priority):
+        self.work = work
+        self.priority = priority
+        self.rejected = 0
+
+    async def __call__(self, handler, event, data):
+        try:
+            await self.work.acquire(self.priority)
+        except Overloaded:
+            self.rejected += 1
+            if isinstance(event, CallbackQuery):
+                await event.answer()
+            return None
+        try:
+            return await handler(event, data)
+        finally:
+            self.work.release(self.priority)
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """Update-level outer middleware that drops updates already seen.
+
+    Keys are the update id and, for callback queries, the callback id, kept
+    in a bounded LRU so a retried delivery is answered without running any
+    handler."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.duplicates = 0
+        self._seen = OrderedDict()
+
+    def _seen_before(self, key):
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return True
+        self._seen[key] = None
+        if len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+        return False
+
+    async def __call__(self, handler, event, data):
+        if isinstance(event, Update):
+            duplicate = self._seen_before(event.update_id)
+            if event.callback_query is not None:
+                duplicate = self._seen_before(event.callback_query.id) or duplicate
+            if duplicate:
+                self.duplicates += 1
+                return None
+        return await handler(event, data)
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Update-level outer middleware that keeps track of running handlers, so
+    shutdown can wait for them instead of cutting them off."""
+
+    def __init__(self):
+        self._tasks = set()
+
+    @property
+    def in_flight(self):
+        return len(self._tasks)
+
+    async def __call__(self, handler, event, data):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self._tasks.discard(task)
+
+    async def drain(self):
+        """Wait for the handlers in flight; cancelling the wait cancels them."""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# how many missed boundaries are replayed after a stall (e.g. a blocked loop
+# or a suspended VM) before the remaining ones are counted as skipped
+MAX_CATCHUP_TICKS = 5
+
+
+def next_boundary(now, period):
+    """Return the first wall-clock multiple of ``period`` strictly after ``now``."""
+    return (now // period + 1) * period
+
+
+class PeriodicTask:
+    def __init__(self, name, func, period=60, replay=False):
+        self.name = name
+        self.func = func
+        self.period = period
+        self.replay = replay
+
+        self.runs = 0
+        self.failures = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.last_tick = None
+        self.last_duration = None
+        self.last_error = None
+
+        self._loop_task = None
+        self._running = {}
+        self._last_fired = None
+        self._unfinished = None
+        self._failed = set()
+
+    @property
+    def running(self):
+        return self._loop_task is not None and not self._loop_task.done()
+
+    @property
+    def checkpoint(self):
+        """Latest boundary up to which every fired run has finished, and
+        succeeded if the task is replayed."""
+        pending = list(self._running.values()) + list(self._failed)
+        if self._unfinished is not None:
+            pending.append(self._unfinished)
+        if pending:
+            return min(pending) - self.period
+        return self._last_fired
+
+    def start(self, resume_after=None):
+        """Start ticking; with ``resume_after`` (a previous ``checkpoint``) the
+        boundaries missed since then are replayed first, up to the catch-up
+        limit."""
+        if not self.running:
+            self._last_fired = resume_after
+            self._loop_task = asyncio.create_task(
+                self._loop(resume_after), name=self.name
+            )
+
+    async def _stop_loop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+
+    async def stop(self):
+        tasks = list(self._running)
+        for task in tasks:
+            task.cancel()
+        await self._stop_loop()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def drain(self):
+        """Stop firing new ticks and wait for the runs in flight; runs still
+        going when the caller gives up are cancelled with it."""
+        await self._stop_loop()
+        await asyncio.gather(*self._running)
+
+    def health(self):
+        return {
+            "running": self.running,
+            "in_flight": len(self._running),
+            "runs": self.runs,
+            "failures": self.failures,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "failed_ticks": len(self._failed),
+            "last_tick": self.last_tick,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+        }
+
+    async def _sleep_until(self, tick):
+        # asyncio timers run on the monotonic clock, so the sleep itself does
+        # not drift; re-checking the wall clock afterwards protects against
+        # early wake-ups and clock adjustments while sleeping.
+        while True:
+            delay = tick - time.time()
+            if delay <= 0:
+                return
+            deadline = time.monotonic() + delay
+            await asyncio.sleep(delay)
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+    async def _loop(self, resume_after=None):
+        tick = next_boundary(time.time(), self.period)
+        if resume_after is not None:
+            earliest = tick - MAX_CATCHUP_TICKS * self.period
+            tick = min(max(next_boundary(resume_after, self.period), earliest), tick)
+        while True:
+            await self._sleep_until(tick)
+            self._fire(tick)
+            tick += self.period
+
+            behind = int((time.time() - tick) // self.period) + 1
+            if behind > MAX_CATCHUP_TICKS:
+                self.skipped += behind - MAX_CATCHUP_TICKS
+                logger.warning(
+                    "%s: %d ticks skipped after a stall",
+                    self.name,
+                    behind - MAX_CATCHUP_TICKS,
+                )
+                tick += (behind - MAX_CATCHUP_TICKS) * self.period
+
+    def _fire(self, tick):
+        if self._running:
+            # previous run is still busy; let it finish in the background
+            # instead of pushing this tick back
+            self.overruns += 1
+            logger.warning("%s: tick started while previous run active", self.name)
+
+        # failed runs of a replayed task are retried alongside the next tick
+        retries, self._failed = sorted(self._failed), set()
+        for failed in retries:
+            self._spawn(failed)
+        self._spawn(tick)
+        self._last_fired = tick
+
+    def _spawn(self, tick):
+        task = asyncio.create_task(
+            self._run(datetime.fromtimestamp(tick, tz=timezone.utc))
+        )
+        self._running[task] = tick
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        tick = self._running.pop(task)
+        if task.cancelled():
+            # never finished, so the checkpoint must not move past it
+            if self._unfinished is None or tick < self._unfinished:
+                self._unfinished = tick
+        elif not task.result() and self.replay:
+            # held like an unfinished run, within the same catch-up limit
+            self._failed.add(tick)
+            if len(self._failed) > MAX_CATCHUP_TICKS:
+                self._failed.remove(min(self._failed))
+                self.skipped += 1
+                logger.warning("%s: oldest failed tick given up", self.name)
+
+    async def _run(self, tick):
+        started = time.monotonic()
+        self.last_tick = tick
+        try:
+            await self.func(tick)
+            return True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            self.last_error = repr(e)
+            logger.exception("%s: run for %s failed", self.name, tick)
+            return False
+        finally:
+            self.runs += 1
+            self.last_duration = time.monotonic() - started
+
+
+class PeriodicScheduler:
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, func, period=60, replay=False):
+        """Register ``func(tick)`` to run on every wall-clock multiple of ``period``
+        seconds. ``tick`` is the aware UTC datetime of the boundary being served,
+        which may lie slightly in the past if the loop was busy. Only tasks with
+        ``replay`` are checkpointed and have their missed or failed ticks replayed."""
+        if name in self.tasks:
+            raise ValueError(f"Periodic task {name!r} already registered")
+        self.tasks[name] = PeriodicTask(name, func, period, replay)
+        return self.tasks[name]
+
+    def start(self, checkpoints=None):
+        checkpoints = checkpoints or {}
+        for name, task in self.tasks.items():
+            task.start(checkpoints.get(name) if task.replay else None)
+
+    async def stop(self):
+        await asyncio.gather(*(task.stop() for task in self.tasks.values()))
+
+    async def drain(self):
+        await asyncio.gather(*(task.drain() for task in self.tasks.values()))
+
+    def checkpoints(self):
+        return {
+            name: task.checkpoint
+            for name, task in self.tasks.items()
+            if task.replay and task.checkpoint is not None
+        }
+
+    def health(self):
+        return {name: task.health() for name, task in self.tasks.items()}
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+import pytz
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+
+from menus import task_title
+from utils.db.backend import storage
+from utils.db.backup import create_backup
+from utils.db.db import time_format
+from utils.db.settings_cache import settings
+from utils.i18n import get_i18n
+from utils.message_packer import pack_lines
+from utils.work import DIGEST, NOTIFICATION, Overloaded, work
+
+logger = logging.getLogger(__name__)
+
+moscow_tz = pytz.timezone("Europe/Moscow")
+DIGEST_LIMIT = 20
+
+OUTBOX_BATCH = 100
+# how long a claimed entry is reserved for one sender before it is due again
+OUTBOX_LEASE = 60
+OUTBOX_MAX_ATTEMPTS = 8
+# entries shed under load are tried again after this many seconds
+OUTBOX_SHED_DELAY = 30
+WORK_CLASSES = {"reminder": DIGEST, "notification": NOTIFICATION}
+
+
+async def _digest_lines(user_id, today):
+    # open tasks that are due, overdue or undated, most important first,
+    # straight off the index
+    for task in await storage.get_due_tasks(user_id, today, DIGEST_LIMIT):
+        task_id, name, description, status, priority, due_at = task
+        yield f"{task_title(name, priority, due_at)} ❌"
+
+
+def _retry_delay(attempts):
+    return min(5 * 2**attempts, 3600)
+
+
+async def _deliver(bot, kind, user_id, ref, payload):
+    i18n = get_i18n()
+    _ = i18n.translator(await i18n.locale_for(user_id))
+    if kind == "reminder":
+        today = datetime.strptime(ref, "%d.%m.%Y").date().isoformat()
+        lines = _digest_lines(user_id, today)
+        async for text in pack_lines(lines, header=_("tasks_for_today")):
+            await bot.send_message(user_id, text)
+    else:
+        await bot.send_message(user_id, f"{_('notification_details')} {payload}")
+
+
+async def deliver_outbox(bot, tick=None):
+    """Send due outbox entries; delivered ones are deleted per batch.
+
+    Entries of a batch are sent concurrently, each in a slot of its work
+    class. Delivery is at-least-once: an entry sent just before a crash is
+    sent again once its lease runs out."""
+    while True:
+        now = time.time()
+        entries = await storage.claim_outbox(now, OUTBOX_LEASE, OUTBOX_BATCH)
+        delivered, retries, released = [], [], []
+        hold_until = None
+
+        async def deliver(entry_id, kind, user_id, ref, payload, attempts):
+            nonlocal hold_until
+            try:
+                async with work.slot(WORK_CLASSES[kind]):
+                    if hold_until is not None:
+                        # flood control was hit while this one was queued
+                        released.append((entry_id, hold_until))
+                        return
+                    await _deliver(bot, kind, user_id, ref, payload)
+            except Overloaded:
+                released.append((entry_id, now + OUTBOX_SHED_DELAY))
+            except TelegramRetryAfter as e:
+                # flood control: hold back the rest of the batch as well
+                hold_until = max(hold_until or 0, time.time() + e.retry_after)
+                retries.append((entry_id, hold_until))
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # blocked bot or deleted chat; retrying cannot help
+                logger.warning("outbox %s to %s dropped: %s", kind, user_id, e)
+                delivered.append(entry_id)
+            except Exception:
+                if attempts >= OUTBOX_MAX_ATTEMPTS:
+                    logger.exception("outbox %s to %s: giving up", kind, user_id)
+                    delivered.append(entry_id)
+                else:
+                    logger.warning(
+                        "outbox %s to %s failed (attempt %d)",
+                        kind,
+                        user_id,
+                        attempts,
+                        exc_info=True,
+                    )
+                    retries.append((entry_id, now + _retry_delay(attempts)))
+            else:
+                delivered.append(entry_id)
+
+        try:
+            await asyncio.gather(*(deliver(*entry) for entry in entries))
+        finally:
+            # also on cancellation, so finished sends are not repeated
+            await asyncio.shield(
+                storage.complete_outbox(delivered, retries, released)
+            )
+        # anything held back or shed is left to a later run
+        if hold_until is not None or released or len(entries) < OUTBOX_BATCH:
+            return
+
+
+async def send_reminders(bot, tick):
+    now = tick.astimezone(moscow_tz)
+    # reminder times may still be waiting in the write-behind cache
+    await settings.flush()
+    await storage.enqueue_reminders(
+        now.strftime(time_format), now.strftime("%d.%m.%Y")
+    )
+    await deliver_outbox(bot)
+
+
+async def send_notifications(bot, tick):
+    now = tick.astimezone(moscow_tz)
+    await storage.enqueue_due_notifications(
+        now.strftime("%d.%m.%Y"), now.strftime(time_format)
+    )
+    await deliver_outbox(bot)
+
+
+async def clear_database(tick):
+    await storage.clear_tasks()
+    await storage.clear_notifications()
+
+
+async def backup_database(tick):
+    path, size, seconds = await create_backup()
+    logger.info("Backup %s: %d bytes in %.1f s", path.name, size, seconds)
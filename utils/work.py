@@ -0,0 +1,155 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# lower runs first
+INTERACTIVE, NOTIFICATION, DIGEST = 0, 1, 2
+# queue waits kept per class for the exported percentiles
+WAIT_SAMPLES = 1000
+
+
+class Overloaded(Exception):
+    pass
+
+
+def _percentile(values, fraction):
+    return values[int(fraction * (len(values) - 1))] if values else None
+
+
+class _WorkClass:
+    def __init__(self, name, limit, max_queue, shed):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.shed = shed
+
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.waiters = deque()
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    def health(self):
+        waits = sorted(self.waits)
+        return {
+            "running": self.running,
+            "queued": len(self.waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_p50": _percentile(waits, 0.5),
+            "wait_p99": _percentile(waits, 0.99),
+            "wait_max": waits[-1] if waits else None,
+        }
+
+
+class WorkScheduler:
+    """Priority admission for handler and background work.
+
+    At most ``capacity`` units run at once and each class at most its own
+    ``limit``, so lower classes can never take all of the capacity. A freed
+    slot goes to the highest-priority class that can use it. Queues are
+    bounded: work arriving at a full queue is refused with ``Overloaded``.
+    Classes added with ``shed=True`` are also refused, and their queue
+    dropped, while all capacity is taken and a higher class is queued."""
+
+    def __init__(self, capacity=32):
+        self.capacity = capacity
+        self.running = 0
+        self._classes = {}
+
+    def add_class(self, priority, name, limit, max_queue, shed=False):
+        if priority in self._classes:
+            raise ValueError(f"Work class {priority} already registered")
+        self._classes[priority] = _WorkClass(name, limit, max_queue, shed)
+        self._classes = dict(sorted(self._classes.items()))
+
+    def _can_start(self, work_class):
+        return self.running < self.capacity and work_class.running < work_class.limit
+
+    def _overloaded(self, priority):
+        return self.running >= self.capacity and any(
+            work_class.waiters
+            for other, work_class in self._classes.items()
+            if other < priority
+        )
+
+    def _start(self, work_class, queued_at):
+        self.running += 1
+        work_class.running += 1
+        work_class.admitted += 1
+        work_class.waits.append(time.monotonic() - queued_at)
+
+    def _shed_below(self, priority):
+        for other, work_class in self._classes.items():
+            if other > priority and work_class.shed:
+                while work_class.waiters:
+                    future, queued_at = work_class.waiters.popleft()
+                    if not future.done():
+                        work_class.rejected += 1
+                        future.set_exception(Overloaded(work_class.name))
+
+    def _wake(self):
+        for work_class in self._classes.values():
+            while work_class.waiters and self._can_start(work_class):
+                future, queued_at = work_class.waiters.popleft()
+                if not future.done():
+                    self._start(work_class, queued_at)
+                    future.set_result(None)
+
+    async def acquire(self, priority):
+        work_class = self._classes[priority]
+        now = time.monotonic()
+        # waiters that could start were woken on release, so an empty queue
+        # and a free slot mean nothing more important is ahead
+        if not work_class.waiters and self._can_start(work_class):
+            self._start(work_class, now)
+            return
+        if len(work_class.waiters) >= work_class.max_queue or (
+            work_class.shed and self._overloaded(priority)
+        ):
+            work_class.rejected += 1
+            raise Overloaded(work_class.name)
+
+        waiter = (asyncio.get_running_loop().create_future(), now)
+        work_class.waiters.append(waiter)
+        if self.running >= self.capacity:
+            self._shed_below(priority)
+        try:
+            await waiter[0]
+        except asyncio.CancelledError:
+            future = waiter[0]
+            if future.done() and not future.cancelled() and not future.exception():
+                # the slot was granted just before the cancellation
+                self.release(priority)
+            elif waiter in work_class.waiters:
+                work_class.waiters.remove(waiter)
+            raise
+
+    def release(self, priority):
+        work_class = self._classes[priority]
+        self.running -= 1
+        work_class.running -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def health(self):
+        return {
+            work_class.name: work_class.health()
+            for work_class in self._classes.values()
+        }
+
+
+# handlers first, then notifications that are due now, then daily digests;
+# scheduler work never holds more than 12 of the 32 slots
+work = WorkScheduler(capacity=32)
+work.add_class(INTERACTIVE, "interactive", limit=32, max_queue=256)
+work.add_class(NOTIFICATION, "notifications", limit=8, max_queue=512)
+work.add_class(DIGEST, "digests", limit=4, max_queue=256, shed=True)